@@ -1,7 +1,25 @@
 from flask import Flask, jsonify, request
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 app = Flask(__name__)
 
@@ -17,9 +35,1395 @@ users = {
 
 # OpenWeatherMap Configuration
 # Get your free API key from https://openweathermap.org/api
-OPENWEATHER_API_KEY = 'YOUR_API_KEY_HERE'  # Replace with your actual API key
-GEOCODING_API_URL = 'https://api.openweathermap.org/geo/1.0/direct'
-WEATHER_API_URL = 'https://api.openweathermap.org/data/2.5/weather'
+OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY', 'YOUR_API_KEY_HERE')  # Replace with your actual API key
+# Set OPENWEATHER_BASE_URL (or each URL) to use another server, such as
+# openweather_stub.py for offline load testing
+OPENWEATHER_BASE_URL = os.environ.get('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org')
+GEOCODING_API_URL = os.environ.get('GEOCODING_API_URL', f'{OPENWEATHER_BASE_URL}/geo/1.0/direct')
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', f'{OPENWEATHER_BASE_URL}/data/2.5/weather')
+GROUP_API_URL = os.environ.get('GROUP_API_URL', f'{OPENWEATHER_BASE_URL}/data/2.5/group')
+FORECAST_API_URL = os.environ.get('FORECAST_API_URL', f'{OPENWEATHER_BASE_URL}/data/2.5/forecast')
+
+
+# ============================================================================
+# UPSTREAM HTTP CLIENT
+# ============================================================================
+
+# (connect, read) timeouts in seconds for every OpenWeatherMap call
+UPSTREAM_TIMEOUT = (3.05, 10)
+
+# Keep-alive connections kept open per upstream host
+UPSTREAM_POOL_SIZE = 20
+
+# Retry connection errors and 5xx answers with jittered exponential backoff.
+# raise_on_status=False hands the last response back so the status checks
+# in the endpoints still decide what the client sees. Retry-After is left to
+# the upstream quota (see UPSTREAM QUOTA): urllib3 would otherwise sleep for
+# it inside the request thread, up to a minute after a 429.
+UPSTREAM_RETRIES = Retry(
+    total=2,
+    backoff_factor=0.2,
+    backoff_jitter=0.1,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=frozenset({'GET'}),
+    respect_retry_after_header=False,
+    raise_on_status=False
+)
+
+# One adapter (and therefore one set of per-host connection pools) shared by
+# every thread. urllib3 pools are thread-safe; Session objects are not
+# guaranteed to be, so each worker thread gets its own thin Session.
+upstream_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=UPSTREAM_POOL_SIZE,
+    max_retries=UPSTREAM_RETRIES
+)
+upstream_local = threading.local()
+
+
+def upstream_session():
+    """Return this thread's Session, mounted on the shared connection pools"""
+    session = getattr(upstream_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.mount('https://', upstream_adapter)
+        session.mount('http://', upstream_adapter)
+        upstream_local.session = session
+    return session
+
+
+def upstream_get(url, params, breaker):
+    """GET an upstream URL within the call quota, reusing a pooled keep-alive connection"""
+    trial = breaker.before_call()
+    try:
+        upstream_quota.acquire()
+    except QuotaExceededError:
+        breaker.release(trial)
+        raise
+    try:
+        response = hedged_get(url, params, hedge_policies[breaker.name])
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    breaker.record_response(response.status_code, trial)
+    check_throttled(response)
+    return response
+
+
+class UpstreamError(Exception):
+    """An upstream call failed; payload and status are what the client receives"""
+
+    def __init__(self, payload, status=502):
+        super().__init__(payload.get('message', payload['error']))
+        self.payload = payload
+        self.status = status
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+metrics = Counter()
+metrics_lock = threading.Lock()
+
+
+def count(name, amount=1):
+    """Increment a counter exposed on GET /metrics"""
+    with metrics_lock:
+        metrics[name] += amount
+
+
+def hit_rate(counters, hits, misses):
+    """Hit ratio for a set of counters (None when nothing was looked up yet)"""
+    hit_count = sum(counters.get(name, 0) for name in hits)
+    total = hit_count + sum(counters.get(name, 0) for name in misses)
+    return round(hit_count / total, 4) if total else None
+
+
+# ============================================================================
+# CIRCUIT BREAKERS
+# ============================================================================
+
+# During an OpenWeatherMap outage every call would still wait for its
+# timeouts and retries before failing. After CIRCUIT_FAILURE_THRESHOLD
+# consecutive failures a breaker opens and its upstream is not called at all
+# for CIRCUIT_RESET_TIMEOUT seconds; then a single trial call decides whether
+# it closes again.
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__({
+            'error': f'{name.capitalize()} API unavailable',
+            'message': 'OpenWeatherMap keeps failing, so it is not being called for now',
+            'retry_after': retry_after
+        }, 503)
+
+
+class CircuitBreaker:
+    """
+    closed:    calls go through; `threshold` consecutive failures open it
+    open:      calls fail fast with CircuitOpenError for `reset_timeout` seconds
+    half-open: one trial call closes it again, or reopens it on failure
+    """
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless this call may go to the upstream.
+        Returns True when the call is the half-open trial, which must then
+        report back with record_*() or give the slot up with release().
+        """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return False
+            now = time.monotonic()
+            # Half-open lets one trial through. A trial that never reports
+            # back (its caller died) is replaced after reset_timeout.
+            if state == 'half-open' and (
+                self.trial_started is None or now - self.trial_started > self.reset_timeout
+            ):
+                self.trial_started = now
+                return True
+            retry_after = max(1, round(self.opened_at + self.reset_timeout - now))
+
+        count(f'circuit_{self.name}_rejected')
+        raise CircuitOpenError(self.name, retry_after)
+
+    def release(self, trial):
+        """The call never learnt anything about the upstream: let another call be the trial"""
+        if trial:
+            with self.lock:
+                self.trial_started = None
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = self.trial_started = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            opened = self.state == 'half-open' or (
+                self.opened_at is None and self.failures >= self.threshold
+            )
+            if opened:
+                self.opened_at = time.monotonic()
+                self.trial_started = None
+        if opened:
+            count(f'circuit_{self.name}_opened')
+
+    def record_response(self, status_code, trial=False):
+        """
+        Server errors count as failures, anything else as success. A 429
+        says nothing about the upstream's health and is left to the upstream
+        quota, which pauses for its Retry-After; a trial that got one frees
+        its slot.
+        """
+        if status_code >= 500:
+            self.record_failure()
+        elif status_code != 429:
+            self.record_success()
+        else:
+            self.release(trial)
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+geocoding_breaker = CircuitBreaker('geocoding', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+weather_breaker = CircuitBreaker('weather', CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+
+
+# ============================================================================
+# UPSTREAM QUOTA
+# ============================================================================
+
+# OpenWeatherMap plans allow a fixed number of calls per minute (60 on the
+# free tier). Every upstream call takes a token from a bucket that refills at
+# UPSTREAM_CALLS_PER_MINUTE / 60 per second and holds up to UPSTREAM_BURST.
+# While it is empty, callers queue by priority: interactive /weather requests
+# first, batch lookups next, background refreshes last. A caller that would
+# wait longer than QUOTA_MAX_WAIT for its priority is shed at once with a 503,
+# and the weather cache serves its last value instead where it has one. A 429
+# pauses the bucket for its Retry-After. UPSTREAM_CALLS_PER_MINUTE=0 removes
+# the limit but still honours Retry-After.
+UPSTREAM_CALLS_PER_MINUTE = int(os.environ.get('UPSTREAM_CALLS_PER_MINUTE', 60))
+UPSTREAM_BURST = int(os.environ.get('UPSTREAM_BURST', 10))
+
+PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ('interactive', 'batch', 'background')
+# Longest wait for a token, in seconds, per priority
+QUOTA_MAX_WAIT = (2.0, 5.0, 15.0)
+# Pause after a 429 without a usable Retry-After (quotas are per minute)
+QUOTA_DEFAULT_RETRY_AFTER = 60
+
+# Priority of the upstream calls made by the current thread or task
+upstream_priority = contextvars.ContextVar('upstream_priority', default=PRIORITY_INTERACTIVE)
+
+
+class QuotaExceededError(UpstreamError):
+    """Raised instead of calling an upstream when the call budget is spent"""
+
+    def __init__(self, retry_after):
+        super().__init__({
+            'error': 'Upstream quota exhausted',
+            'message': 'Too many OpenWeatherMap calls right now, please try again shortly',
+            'retry_after': retry_after
+        }, 503)
+
+
+class QuotaWaiter:
+    """A queued caller; wake() is called from the dispatcher once it holds a token"""
+
+    def __init__(self, priority, wake):
+        self.priority = priority
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class UpstreamQuota:
+    """
+    Token bucket shared by all threads and the event loop. Callers that
+    cannot take a token right away are queued in a heap ordered by
+    (priority, arrival) and granted tokens by a dispatcher thread.
+    """
+
+    def __init__(self, calls_per_minute, burst):
+        self.rate = calls_per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = []        # heap of (priority, sequence, QuotaWaiter)
+        self.sequence = 0
+        self.recent = deque()    # grant times within the last minute
+        self.condition = threading.Condition()
+        self.dispatcher = None
+
+    # The helpers below expect self.condition to be held
+
+    def refill(self, now):
+        if self.rate:
+            elapsed = max(0.0, now - self.updated)
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, now, tokens_needed=1):
+        """Seconds until tokens_needed tokens are available and no pause applies"""
+        shortfall = tokens_needed - self.tokens if self.rate else 0
+        return max(self.paused_until - now, shortfall / self.rate if shortfall > 0 else 0.0)
+
+    def take(self, now):
+        if self.rate:
+            self.tokens -= 1
+        self.recent.append(now)
+        while self.recent[0] <= now - 60:
+            self.recent.popleft()
+
+    def enqueue(self, wake):
+        """Take a token (returns None) or queue a waiter; raises QuotaExceededError"""
+        priority = upstream_priority.get()
+        waiter = shed_after = None
+        with self.condition:
+            now = time.monotonic()
+            self.refill(now)
+            queued = [entry for entry in self.waiting if not entry[2].cancelled]
+            if not queued and self.wait_time(now) == 0:
+                self.take(now)
+            else:
+                # Tokens go to everyone queued at this priority or above first
+                ahead = sum(1 for entry in queued if entry[0] <= priority)
+                expected = self.wait_time(now, ahead + 1)
+                if expected > QUOTA_MAX_WAIT[priority]:
+                    shed_after = expected
+                else:
+                    waiter = QuotaWaiter(priority, wake)
+                    self.sequence += 1
+                    heapq.heappush(self.waiting, (priority, self.sequence, waiter))
+                    self.start_dispatcher()
+                    self.condition.notify()
+
+        if shed_after is not None:
+            count(f'quota_{PRIORITY_NAMES[priority]}_shed')
+            raise QuotaExceededError(max(1, round(shed_after)))
+        if waiter is None:
+            count(f'quota_{PRIORITY_NAMES[priority]}_granted')
+        return waiter
+
+    def settle(self, waiter):
+        """Withdraw a waiter that gave up, or confirm it holds a token"""
+        with self.condition:
+            if not waiter.granted:
+                waiter.cancelled = True
+                retry_after = max(1, round(self.wait_time(time.monotonic(), len(self.waiting))))
+        name = PRIORITY_NAMES[waiter.priority]
+        if not waiter.granted:
+            count(f'quota_{name}_shed')
+            raise QuotaExceededError(retry_after)
+        count(f'quota_{name}_granted')
+
+    def acquire(self):
+        """Block until the current thread may make one upstream call"""
+        woken = threading.Event()
+        waiter = self.enqueue(woken.set)
+        if waiter is not None:
+            woken.wait(QUOTA_MAX_WAIT[waiter.priority])
+            self.settle(waiter)
+
+    async def acquire_async(self):
+        """acquire() for coroutines; waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            try:
+                loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+            except RuntimeError:  # the loop was closed meanwhile
+                pass
+
+        waiter = self.enqueue(wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(woken, QUOTA_MAX_WAIT[waiter.priority])
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                with self.condition:
+                    waiter.cancelled = not waiter.granted
+                raise
+            self.settle(waiter)
+
+    def start_dispatcher(self):
+        if self.dispatcher is None:
+            self.dispatcher = threading.Thread(target=self.dispatch, name='upstream-quota', daemon=True)
+            self.dispatcher.start()
+
+    def dispatch(self):
+        """Hand out tokens to queued callers in priority order (dispatcher thread)"""
+        with self.condition:
+            while True:
+                while self.waiting and self.waiting[0][2].cancelled:
+                    heapq.heappop(self.waiting)
+                if not self.waiting:
+                    self.condition.wait()
+                    continue
+                now = time.monotonic()
+                self.refill(now)
+                delay = self.wait_time(now)
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                _, _, waiter = heapq.heappop(self.waiting)
+                self.take(now)
+                waiter.granted = True
+                waiter.wake()
+
+    def pause(self, seconds):
+        """Grant nothing for `seconds` (the upstream answered 429), then refill from empty"""
+        with self.condition:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+            self.condition.notify()
+
+    def spare(self, now):
+        self.refill(now)
+        if self.paused_until > now or any(not entry[2].cancelled for entry in self.waiting):
+            return 0.0
+        return self.tokens if self.rate else float('inf')
+
+    def spare_tokens(self):
+        """Tokens that can be taken right now without making anyone wait"""
+        with self.condition:
+            return self.spare(time.monotonic())
+
+    def try_acquire(self):
+        """Take a spare token if there is one; never waits"""
+        with self.condition:
+            now = time.monotonic()
+            if self.spare(now) < 1:
+                return False
+            self.take(now)
+            return True
+
+    def snapshot(self):
+        with self.condition:
+            now = time.monotonic()
+            self.refill(now)
+            while self.recent and self.recent[0] <= now - 60:
+                self.recent.popleft()
+            waiting = Counter(PRIORITY_NAMES[p] for p, _, waiter in self.waiting if not waiter.cancelled)
+            return {
+                'calls_per_minute': round(self.rate * 60) or None,
+                'used_last_minute': len(self.recent),
+                'tokens': round(self.tokens, 2) if self.rate else None,
+                'waiting': dict(waiting),
+                'paused_for': round(max(0.0, self.paused_until - now), 1)
+            }
+
+
+upstream_quota = UpstreamQuota(UPSTREAM_CALLS_PER_MINUTE, UPSTREAM_BURST)
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return QUOTA_DEFAULT_RETRY_AFTER
+
+
+def check_throttled(response):
+    """On a 429, pause the quota for its Retry-After and raise QuotaExceededError"""
+    if response.status_code == 429:
+        retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+        upstream_quota.pause(retry_after)
+        count('upstream_throttled')
+        raise QuotaExceededError(max(1, round(retry_after)))
+
+
+# ============================================================================
+# HEDGED REQUESTS
+# ============================================================================
+
+# A few upstream answers are much slower than the rest, and they set the p99.
+# With HEDGE_PERCENTILE set (e.g. 95), a call still unanswered after that
+# percentile of its upstream's recent latencies is sent a second time, to
+# HEDGE_BASE_URL when configured (a secondary provider or region) or to the
+# same URL, and whichever answers first is used. Hedges are capped at
+# HEDGE_MAX_RATE of all calls and only use spare quota tokens. Off by default
+# because every hedge is an extra call against the plan.
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))
+HEDGE_MAX_RATE = float(os.environ.get('HEDGE_MAX_RATE', 0.05))
+HEDGE_BASE_URL = os.environ.get('HEDGE_BASE_URL', '')
+HEDGE_MIN_DELAY = 0.02   # never hedge sooner than this, in seconds
+HEDGE_WINDOW = 1000      # latencies kept per upstream
+HEDGE_MIN_SAMPLES = 50   # no hedging until this many were seen
+HEDGE_MAX_CREDIT = 10    # unused hedge allowance that can build up
+
+# Runs the calls being hedged, so the caller can take whichever answers first
+hedge_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix='upstream-hedge')
+
+
+class HedgePolicy:
+    """Tracks one upstream's latency percentile and its allowance of hedges"""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = deque(maxlen=HEDGE_WINDOW)
+        self.new_samples = 0
+        self.hedge_delay = None
+        self.credit = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Record the latency of a successful call"""
+        with self.lock:
+            self.samples.append(seconds)
+            self.new_samples += 1
+            # Re-sorting on every call would cost more than it saves
+            if len(self.samples) >= HEDGE_MIN_SAMPLES and self.new_samples >= HEDGE_MIN_SAMPLES // 2:
+                ordered = sorted(self.samples)
+                index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+                self.hedge_delay = max(HEDGE_MIN_DELAY, ordered[index])
+                self.new_samples = 0
+
+    def delay(self):
+        """Seconds to wait before hedging a new call, or None not to hedge it"""
+        with self.lock:
+            self.credit = min(HEDGE_MAX_CREDIT, self.credit + HEDGE_MAX_RATE)
+            return self.hedge_delay
+
+    def allow_hedge(self):
+        """Spend one hedge from the allowance and the quota, if both have one"""
+        with self.lock:
+            if self.credit < 1:
+                allowed = False
+            else:
+                allowed = upstream_quota.try_acquire()
+                if allowed:
+                    self.credit -= 1
+        count(f'hedge_{self.name}_sent' if allowed else f'hedge_{self.name}_skipped')
+        return allowed
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'delay_ms': round(self.hedge_delay * 1000, 1) if self.hedge_delay else None,
+                'samples': len(self.samples)
+            }
+
+
+hedge_policies = {name: HedgePolicy(name) for name in ('geocoding', 'weather')}
+
+
+def hedge_url(url):
+    """The URL a hedge goes to: the same one, or the same path on HEDGE_BASE_URL"""
+    if HEDGE_BASE_URL and url.startswith(OPENWEATHER_BASE_URL):
+        return HEDGE_BASE_URL + url[len(OPENWEATHER_BASE_URL):]
+    return url
+
+
+def timed_get(url, params, policy):
+    """session GET that feeds the policy's latency percentile"""
+    started = time.monotonic()
+    response = upstream_session().get(url, params=params, timeout=UPSTREAM_TIMEOUT)
+    if response.status_code < 500:
+        policy.observe(time.monotonic() - started)
+    return response
+
+
+def hedged_get(url, params, policy):
+    """
+    GET url, and the same request again if the first has not answered after
+    the policy's delay. Returns the first successful response; raises the
+    original call's exception when both fail.
+    """
+    delay = policy.delay() if HEDGE_PERCENTILE > 0 else None
+    if delay is None:
+        return timed_get(url, params, policy)
+
+    primary = hedge_executor.submit(timed_get, url, params, policy)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+    if not policy.allow_hedge():
+        return primary.result()
+
+    hedge = hedge_executor.submit(timed_get, hedge_url(url), params, policy)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    count(f'hedge_{policy.name}_won')
+                return future.result()
+    return primary.result()
+
+
+async def hedged_get_async(get, url, params, policy):
+    """hedged_get() for coroutines; `get(url, params)` makes one call"""
+    async def timed(target):
+        started = time.monotonic()
+        response = await get(target, params)
+        if response.status_code < 500:
+            policy.observe(time.monotonic() - started)
+        return response
+
+    delay = policy.delay() if HEDGE_PERCENTILE > 0 else None
+    if delay is None:
+        return await timed(url)
+
+    primary = asyncio.ensure_future(timed(url))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or not policy.allow_hedge():
+        return await primary
+
+    hedge = asyncio.ensure_future(timed(hedge_url(url)))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        count(f'hedge_{policy.name}_won')
+                    return task.result()
+        return primary.result()
+    finally:
+        # Unlike a thread, the slower call can simply be abandoned
+        for task in pending:
+            task.cancel()
+
+
+# ============================================================================
+# REQUEST COALESCING
+# ============================================================================
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result or exception.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+
+        if not leader:
+            count(f'{self.name}_coalesced')
+            return future.result()
+
+        try:
+            result = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+# ============================================================================
+# OFFLINE GAZETTEER
+# ============================================================================
+
+# Most traffic asks for well-known cities, so coordinates are looked up in a
+# local GeoNames-style file first and the Geocoding API is only called on a
+# miss. The bundled sample covers a few dozen large cities; for real
+# coverage point GAZETTEER_PATH at cities15000.txt and GAZETTEER_ADMIN1_PATH
+# at admin1CodesASCII.txt from https://download.geonames.org/export/dump/.
+# Set GAZETTEER_PATH to an empty string to always use the API.
+#
+# The text file is compiled once into a sorted binary index that is
+# memory-mapped, so lookups are a binary search over shared, lazily loaded
+# pages instead of a dict of Python objects in every worker process. The
+# index is trusted as it is, so it is kept in the app's instance folder;
+# when it cannot be built there, the app runs without it.
+GAZETTEER_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', os.path.join(GAZETTEER_DATA_DIR, 'cities_sample.txt'))
+GAZETTEER_ADMIN1_PATH = os.environ.get(
+    'GAZETTEER_ADMIN1_PATH', os.path.join(GAZETTEER_DATA_DIR, 'admin1_sample.txt')
+)
+GAZETTEER_INDEX_PATH = os.environ.get('GAZETTEER_INDEX_PATH', os.path.join(app.instance_path, 'gazetteer.idx'))
+
+
+def normalize_place_name(name):
+    """'  São   PAULO ' -> 'sao paulo' (case, accents and spacing ignored)"""
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+def read_geonames(path):
+    """Yield the tab-separated fields of each line, skipping # comments"""
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if line.strip() and not line.startswith('#'):
+                yield line.rstrip('\n').split('\t')
+
+
+class Gazetteer:
+    """
+    Read-only city index in a memory-mapped file.
+
+    Layout: header, then one uint32 offset per record, then the records
+    sorted by (normalized name, population descending). A record is
+    RECORD followed by its UTF-8 key, display name and state.
+    """
+
+    MAGIC = b'GAZ1'
+    HEADER = struct.Struct('<4sIQ')  # magic, record count, source signature
+    OFFSET = struct.Struct('<I')
+    RECORD = struct.Struct('<ddI2sHHH')  # lat, lon, population, country, key/name/state lengths
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as index_file:
+            self.map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.signature = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC:
+            self.map.close()
+            raise ValueError(f'{index_path} is not a gazetteer index')
+
+    @staticmethod
+    def source_signature(*paths):
+        """Changes whenever one of the source files does"""
+        stats = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths]
+        digest = hashlib.blake2b(repr(stats).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    @classmethod
+    def build(cls, cities_path, admin1_path, index_path, signature):
+        """Compile a GeoNames cities file into an index file"""
+        states = {}
+        if admin1_path:
+            states = {fields[0]: fields[1] for fields in read_geonames(admin1_path)}
+
+        entries = []
+        for fields in read_geonames(cities_path):
+            name, ascii_name, alternate_names = fields[1], fields[2], fields[3]
+            country = fields[8]
+            state = states.get(f'{country}.{fields[10]}', '')
+            population = int(fields[14] or 0)
+            keys = {
+                normalize_place_name(key)
+                for key in (name, ascii_name, *alternate_names.split(','))
+            }
+            for key in keys - {''}:
+                entries.append((key, -population, country, float(fields[4]), float(fields[5]), name, state))
+        entries.sort()
+
+        # Write next to the target and swap it in, so readers never see half a file
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), mode=0o700, exist_ok=True)
+        temporary_path = f'{index_path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'wb') as index_file:
+                index_file.write(cls.HEADER.pack(cls.MAGIC, len(entries), signature))
+                position = cls.HEADER.size + cls.OFFSET.size * len(entries)
+                offsets, records = [], []
+                for key, negative_population, country, lat, lon, name, state in entries:
+                    key, name, state = key.encode(), name.encode(), state.encode()
+                    record = cls.RECORD.pack(
+                        lat, lon, -negative_population, country.encode('ascii'),
+                        len(key), len(name), len(state)
+                    ) + key + name + state
+                    offsets.append(cls.OFFSET.pack(position))
+                    records.append(record)
+                    position += len(record)
+                index_file.write(b''.join(offsets))
+                index_file.write(b''.join(records))
+            os.replace(temporary_path, index_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, cities_path, admin1_path, index_path):
+        """Open the index, (re)building it when the source files changed; None when that fails"""
+        if admin1_path and not os.path.exists(admin1_path):
+            admin1_path = None
+        signature = cls.source_signature(*filter(None, (cities_path, admin1_path)))
+        try:
+            index = cls(index_path)
+            if index.signature == signature:
+                return index
+            index.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        try:
+            cls.build(cities_path, admin1_path, index_path, signature)
+            return cls(index_path)
+        except (OSError, ValueError, struct.error) as e:
+            # Every lookup then goes to the Geocoding API, as without GAZETTEER_PATH
+            app.logger.warning(f'Gazetteer index {index_path} unavailable, geocoding through the API: {e}')
+            return None
+
+    def record(self, position):
+        """(key bytes, country, location dict) of the record at a sorted position"""
+        offset, = self.OFFSET.unpack_from(self.map, self.HEADER.size + self.OFFSET.size * position)
+        lat, lon, _, country, key_length, name_length, state_length = self.RECORD.unpack_from(self.map, offset)
+        start = offset + self.RECORD.size
+        key = self.map[start:start + key_length]
+        start += key_length
+        name = self.map[start:start + name_length].decode()
+        start += name_length
+        state = self.map[start:start + state_length].decode()
+        country = country.decode('ascii')
+        return key, country, {'lat': lat, 'lon': lon, 'name': name, 'country': country, 'state': state}
+
+    def key(self, position):
+        offset, = self.OFFSET.unpack_from(self.map, self.HEADER.size + self.OFFSET.size * position)
+        key_length = self.RECORD.unpack_from(self.map, offset)[4]
+        start = offset + self.RECORD.size
+        return self.map[start:start + key_length]
+
+    def lookup(self, city, country_code=''):
+        """
+        Location dict for a city name, or None when it is not in the index.
+        Without a country code the most populous match wins.
+        """
+        key = normalize_place_name(city).encode()
+        country_code = country_code.strip().upper()
+
+        # Binary search for the first record with this key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        for position in range(low, self.count):
+            record_key, country, location = self.record(position)
+            if record_key != key:
+                break
+            if not country_code or country == country_code:
+                return location
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.map.close()
+
+
+gazetteer = (
+    Gazetteer.load(GAZETTEER_PATH, GAZETTEER_ADMIN1_PATH, GAZETTEER_INDEX_PATH)
+    if GAZETTEER_PATH else None
+)
+
+
+# ============================================================================
+# GEOCODING CACHE
+# ============================================================================
+
+# City coordinates never change, so found locations are cached forever.
+# "City not found" answers are cached for a shorter time in case the
+# upstream database learns about the city later. Cached locations are
+# served as they are, so the on-disk cache lives in the app's instance
+# folder rather than a directory other users can write to.
+GEOCODE_MEMORY_SIZE = 10000
+GEOCODE_NOT_FOUND_TTL = 60 * 60
+GEOCODE_CACHE_PATH = os.environ.get(
+    'GEOCODE_CACHE_PATH', os.path.join(app.instance_path, 'geocode_cache.sqlite3')
+)
+
+
+class LRUCache:
+    """A small thread-safe least-recently-used cache"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.items)
+
+
+class GeocodeStore:
+    """
+    On-disk geocoding results kept in SQLite, so warm restarts skip the
+    upstream call completely.
+
+    Rows are kept per `source` (the geocoding URL), so results from a stub
+    server or another provider are never served for the real one.
+    """
+
+    def __init__(self, path, source):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        self.source = source
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(geocode)')]
+        if columns and 'source' not in columns:
+            # Written before rows had a source: nothing says where they came from
+            self.db.execute('DROP TABLE geocode')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS geocode ('
+            ' source TEXT NOT NULL, city TEXT NOT NULL, country_code TEXT NOT NULL,'
+            ' lat REAL, lon REAL, name TEXT, country TEXT, state TEXT,'
+            ' expires_at REAL,'
+            ' PRIMARY KEY (source, city, country_code))'
+        )
+        self.db.commit()
+
+    def get(self, key):
+        """Return (location or None, expires_at) or None when not stored"""
+        with self.lock:
+            row = self.db.execute(
+                'SELECT lat, lon, name, country, state, expires_at FROM geocode'
+                ' WHERE source = ? AND city = ? AND country_code = ?', (self.source,) + key
+            ).fetchone()
+        if row is None:
+            return None
+        lat, lon, name, country, state, expires_at = row
+        location = None if lat is None else {
+            'lat': lat, 'lon': lon, 'name': name, 'country': country, 'state': state
+        }
+        return location, expires_at
+
+    def set(self, key, location, expires_at):
+        values = (None,) * 5 if location is None else (
+            location['lat'], location['lon'], location['name'], location['country'], location['state']
+        )
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.source,) + key + values + (expires_at,)
+            )
+            self.db.commit()
+
+
+geocode_memory = LRUCache(GEOCODE_MEMORY_SIZE)
+geocode_store = GeocodeStore(GEOCODE_CACHE_PATH, GEOCODING_API_URL)
+geocode_flight = SingleFlight('geocode')
+
+
+def normalize_location_key(city, country_code):
+    """'  new   YORK ', 'us' -> ('new york', 'US')"""
+    return ' '.join(city.split()).casefold(), country_code.strip().upper()
+
+
+def geocoding_params(city, country_code):
+    """Query parameters for the Geocoding API"""
+    # Format: "CityName,CountryCode" (country code is optional but recommended)
+    query = f"{city},{country_code}" if country_code else city
+    return {'q': query, 'appid': OPENWEATHER_API_KEY, 'limit': 1}
+
+
+def parse_location(geo_response, city):
+    """
+    Turn a Geocoding API response (requests or httpx) into a location dict,
+    or None when the city does not exist. Raises UpstreamError on failure.
+    """
+    # Check if the request was successful
+    if geo_response.status_code != 200:
+        raise UpstreamError({
+            'error': 'Geocoding API request failed',
+            'status_code': geo_response.status_code,
+            'message': 'Could not connect to OpenWeatherMap Geocoding API'
+        })
+
+    try:
+        # Parse JSON response from geocoding API
+        geo_data = geo_response.json()
+
+        # Check if city was found
+        if not geo_data or len(geo_data) == 0:
+            return None
+
+        # Extract coordinates and location info from first result
+        return {
+            'lat': geo_data[0]['lat'],
+            'lon': geo_data[0]['lon'],
+            'name': geo_data[0].get('name', city),
+            'country': geo_data[0].get('country', 'Unknown'),
+            'state': geo_data[0].get('state', '')  # Some locations have state info
+        }
+    except (KeyError, IndexError, ValueError) as e:
+        raise UpstreamError({
+            'error': 'Invalid response from Geocoding API',
+            'message': str(e)
+        })
+
+
+def fetch_location(city, country_code):
+    """
+    Resolve a city with the OpenWeatherMap Geocoding API.
+
+    Returns a location dict, or None when the city does not exist.
+    Raises UpstreamError when the API cannot be used.
+    """
+    count('upstream_geocode_calls')
+    try:
+        # Make GET request to geocoding API over a pooled connection
+        geo_response = upstream_get(
+            GEOCODING_API_URL, geocoding_params(city, country_code), geocoding_breaker)
+    except requests.exceptions.RequestException as e:
+        raise UpstreamError({
+            'error': 'Network error',
+            'message': f'Could not connect to Geocoding API: {str(e)}'
+        })
+    return parse_location(geo_response, city)
+
+
+def memory_location(key, now):
+    """Return (True, location) from the memory cache or the gazetteer, or (False, None)"""
+    entry = geocode_memory.get(key)
+    if entry is not None and (entry[1] is None or entry[1] > now):
+        count('geocode_cache_memory_hits')
+        return True, entry[0]
+
+    location = gazetteer.lookup(*key) if gazetteer is not None else None
+    if location is not None:
+        count('geocode_gazetteer_hits')
+        geocode_memory.set(key, (location, None))
+        return True, location
+    return False, None
+
+
+def disk_location(key, now):
+    """Return (True, location) from the disk cache, or (False, None) on a miss"""
+    entry = geocode_store.get(key)
+    if entry is not None and (entry[1] is None or entry[1] > now):
+        count('geocode_cache_disk_hits')
+        geocode_memory.set(key, entry)
+        return True, entry[0]
+
+    count('geocode_cache_misses')
+    return False, None
+
+
+def cached_location(key):
+    """
+    Return (True, location) from the memory cache, the gazetteer or the
+    disk cache, or (False, None)
+    """
+    now = time.time()
+    found, location = memory_location(key, now)
+    if found:
+        return found, location
+    return disk_location(key, now)
+
+
+def store_location(key, location):
+    """Remember a geocoding result in memory and on disk"""
+    expires_at = None if location is not None else time.time() + GEOCODE_NOT_FOUND_TTL
+    geocode_memory.set(key, (location, expires_at))
+    geocode_store.set(key, location, expires_at)
+    return location
+
+
+def geocode(city, country_code=''):
+    """
+    Resolve a city to a location dict (or None if it does not exist),
+    checking the in-process LRU, then SQLite, then the upstream API.
+    """
+    key = normalize_location_key(city, country_code)
+    found, location = cached_location(key)
+    if found:
+        return location
+
+    # Concurrent misses for the same city share one upstream call
+    return geocode_flight.do(key, lambda: store_location(key, fetch_location(city, country_code)))
+
+
+# ============================================================================
+# WEATHER CACHE (stale-while-revalidate)
+# ============================================================================
+
+# OpenWeatherMap refreshes current conditions every few minutes. Entries
+# younger than WEATHER_CACHE_TTL are served as they are; older entries are
+# still served for up to WEATHER_CACHE_MAX_STALE more seconds while one
+# background refresh replaces them, so clients never wait on a slow upstream
+# for a location that is already cached.
+WEATHER_CACHE_TTL = int(os.environ.get('WEATHER_CACHE_TTL', 600))
+WEATHER_CACHE_MAX_STALE = int(os.environ.get('WEATHER_CACHE_MAX_STALE', 3600))
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 5000))
+
+# Conditions a few km apart are effectively the same, so entries are keyed by
+# the geohash cell of the resolved coordinates: suburbs, districts and other
+# nearby places share the weather fetched for the first of them to miss.
+# Cell size by precision: 4 ~ 39 x 20 km, 5 ~ 4.9 x 4.9 km, 6 ~ 1.2 x 0.6 km.
+# 0 keys entries by the exact coordinates instead.
+WEATHER_GEOHASH_PRECISION = int(os.environ.get('WEATHER_GEOHASH_PRECISION', 5))
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+weather_cache = LRUCache(WEATHER_CACHE_SIZE)
+# OpenWeatherMap city ID of each cached location, for group calls
+weather_city_ids = LRUCache(WEATHER_CACHE_SIZE)
+weather_flight = SingleFlight('weather')
+refreshing = set()
+refreshing_lock = threading.Lock()
+
+
+def weather_params(location):
+    """Query parameters for the Current Weather API"""
+    return {
+        'lat': location['lat'],
+        'lon': location['lon'],
+        'appid': OPENWEATHER_API_KEY,
+        'units': 'metric',
+        'lang': 'en'
+    }
+
+
+def weather_response_data(weather_response):
+    """JSON body of a Weather API response (requests or httpx); raises UpstreamError"""
+    if weather_response.status_code != 200:
+        raise UpstreamError({
+            'error': 'Weather API request failed',
+            'status_code': weather_response.status_code,
+            'message': 'Could not retrieve weather information'
+        })
+
+    try:
+        return weather_response.json()
+    except ValueError as e:
+        raise UpstreamError({
+            'error': 'Invalid response from Weather API',
+            'message': str(e)
+        })
+
+
+def weather_from_data(weather_data):
+    """
+    Extract the 'weather', 'wind' and 'timestamp' parts of one city's
+    Weather API data. Raises UpstreamError when fields are missing.
+    """
+    try:
+        # Extract relevant weather information
+        return {
+            'weather': {
+                'temperature': weather_data['main']['temp'],
+                'feels_like': weather_data['main']['feels_like'],
+                'humidity': weather_data['main']['humidity'],
+                'pressure': weather_data['main']['pressure'],
+                'description': weather_data['weather'][0]['description'],
+                'main': weather_data['weather'][0]['main'],
+                'icon': weather_data['weather'][0]['icon']
+            },
+            'wind': {
+                'speed': weather_data['wind']['speed'],
+                'direction': weather_data['wind'].get('deg', 'N/A')
+            },
+            'timestamp': weather_data['dt']
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise UpstreamError({
+            'error': 'Invalid response from Weather API',
+            'message': str(e)
+        })
+
+
+def parse_weather(weather_response):
+    """
+    Return (weather, OpenWeatherMap city ID or None) from a Current Weather
+    API response. Raises UpstreamError on failure.
+    """
+    weather_data = weather_response_data(weather_response)
+    return weather_from_data(weather_data), weather_data.get('id')
+
+
+def fetch_weather(location):
+    """
+    Get (weather, city ID) for a location from the OpenWeatherMap API.
+    Raises UpstreamError when the API cannot be used.
+    """
+    count('upstream_weather_calls')
+    try:
+        # Make GET request to weather API over a pooled connection
+        weather_response = upstream_get(WEATHER_API_URL, weather_params(location), weather_breaker)
+    except requests.exceptions.RequestException as e:
+        raise UpstreamError({
+            'error': 'Network error',
+            'message': f'Could not connect to Weather API: {str(e)}'
+        })
+    return parse_weather(weather_response)
+
+
+def geohash(lat, lon, precision):
+    """Base-32 geohash of a point, `precision` characters long"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    for i in range(precision * 5):
+        # Bits alternate between longitude (even) and latitude (odd)
+        span, value = (lon_range, lon) if i % 2 == 0 else (lat_range, lat)
+        middle = (span[0] + span[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            span[0] = middle
+        else:
+            bits <<= 1
+            span[1] = middle
+        if i % 5 == 4:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+    return ''.join(chars)
+
+
+def weather_cache_key(location):
+    """Cache weather per geohash cell of the resolved location (see WEATHER_GEOHASH_PRECISION)"""
+    if WEATHER_GEOHASH_PRECISION <= 0:
+        return location['lat'], location['lon']
+    return geohash(location['lat'], location['lon'], WEATHER_GEOHASH_PRECISION)
+
+
+def lookup_weather(key):
+    """Return (weather, age in seconds, 'HIT' or 'STALE') from the cache, or None"""
+    entry = weather_cache.get(key)
+    if entry is not None:
+        weather, fetched_at = entry
+        age = time.time() - fetched_at
+        if age < WEATHER_CACHE_TTL:
+            count('weather_cache_hits')
+            return weather, age, 'HIT'
+        if age < WEATHER_CACHE_TTL + WEATHER_CACHE_MAX_STALE:
+            count('weather_cache_stale_hits')
+            return weather, age, 'STALE'
+
+    count('weather_cache_misses')
+    return None
+
+
+def store_weather(key, weather, city_id=None):
+    """Remember fresh weather (and its city ID, when known) for a location"""
+    weather_cache.set(key, (weather, time.time()))
+    if city_id is not None:
+        weather_city_ids.set(key, city_id)
+    return weather
+
+
+def start_refresh(key):
+    """Claim the background refresh for key; False if one is already running"""
+    with refreshing_lock:
+        if key in refreshing:
+            return False
+        refreshing.add(key)
+        return True
+
+
+def finish_refresh(key):
+    with refreshing_lock:
+        refreshing.discard(key)
+
+
+def load_weather(key, location):
+    """Fetch weather for a cache entry and store it; concurrent loads share one call"""
+    return weather_flight.do(key, lambda: store_weather(key, *fetch_weather(location)))
+
+
+def refresh_weather(key, location):
+    """Fetch fresh weather for a cache entry (runs in a background thread)"""
+    upstream_priority.set(PRIORITY_BACKGROUND)
+    try:
+        load_weather(key, location)
+        count('weather_cache_refreshes')
+    except UpstreamError:
+        # Keep serving the stale entry; the next request will try again
+        count('weather_cache_refresh_errors')
+    finally:
+        finish_refresh(key)
+
+
+def peek_weather(key, location):
+    """
+    lookup_weather() that also starts one background refresh when the
+    entry is stale.
+    """
+    cached = lookup_weather(key)
+    if cached is not None and cached[2] == 'STALE' and start_refresh(key):
+        threading.Thread(target=refresh_weather, args=(key, location), daemon=True).start()
+    return cached
+
+
+def last_weather(key):
+    """The cached entry however old, as (weather, age, 'STALE'), or None"""
+    entry = weather_cache.get(key)
+    if entry is None:
+        return None
+    weather, fetched_at = entry
+    return weather, time.time() - fetched_at, 'STALE'
+
+
+def load_or_last_weather(key, location):
+    """
+    Fetch weather for a cache miss. When the upstream fails or its breaker
+    is open, the expired entry (if any) is served as STALE instead.
+    """
+    try:
+        return load_weather(key, location), 0, 'MISS'
+    except UpstreamError:
+        fallback = last_weather(key)
+        if fallback is None:
+            raise
+        count('weather_cache_fallbacks')
+        return fallback
+
+
+def cached_weather(location):
+    """
+    Return (weather, age in seconds, cache status) for a resolved location.
+
+    The status is HIT (fresh), STALE (served while refreshing, or because
+    the upstream is down) or MISS.
+    """
+    key = weather_cache_key(location)
+    record_request(key, location)
+    cached = peek_weather(key, location)
+    if cached is not None:
+        return cached
+
+    return load_or_last_weather(key, location)
+
+
+# ============================================================================
+# WEATHER RESPONSES (shared by the sync and async endpoints)
+# ============================================================================
+
+API_KEY_NOT_CONFIGURED = {
+    'error': 'OpenWeatherMap API key not configured',
+    'message': 'Please set OPENWEATHER_API_KEY in app.py',
+    'help': 'Get a free API key at https://openweathermap.org/api'
+}
+
+
+def city_not_found(city):
+    return {
+        'error': 'City not found',
+        'message': f'Could not find coordinates for city: {city}',
+        'suggestion': 'Try adding a country code, e.g., ?city=Paris&country=FR'
+    }
+
+
+def location_info(location):
+    """The 'location' part of weather responses"""
+    return {
+        'city': location['name'],
+        'country': location['country'],
+        'state': location['state'],
+        'coordinates': {
+            'latitude': location['lat'],
+            'longitude': location['lon']
+        }
+    }
+
+
+def weather_info(location, weather):
+    """Combine a resolved location and its weather into the response body"""
+    return {
+        'location': location_info(location),
+        **weather
+    }
+
+
+def cache_headers(age, cache_status):
+    return {'Age': str(int(age)), 'X-Cache': cache_status}
 
 
 # ============================================================================
@@ -125,127 +1529,977 @@ def weather():
 
     # Validate API key is configured
     if OPENWEATHER_API_KEY == 'YOUR_API_KEY_HERE':
-        return jsonify({
-            'error': 'OpenWeatherMap API key not configured',
-            'message': 'Please set OPENWEATHER_API_KEY in app.py',
-            'help': 'Get a free API key at https://openweathermap.org/api'
-        }), 500
+        return jsonify(API_KEY_NOT_CONFIGURED), 500
 
     # ========================================================================
     # STEP 1: Get coordinates from city name using Geocoding API
     # ========================================================================
 
-    # Build the geocoding query
-    # Format: "CityName,CountryCode" (country code is optional but recommended)
-    query = f"{city},{country_code}" if country_code else city
+    # Resolve coordinates (cached in memory and on disk, see geocode())
+    try:
+        location = geocode(city, country_code)
+    except UpstreamError as e:
+        return jsonify(e.payload), e.status
+
+    # Check if city was found
+    if location is None:
+        return jsonify(city_not_found(city)), 404
+
+    # ========================================================================
+    # STEP 2: Get weather data using coordinates
+    # ========================================================================
+
+    # Current conditions are cached per location (see cached_weather())
+    try:
+        weather, age, cache_status = cached_weather(location)
+    except UpstreamError as e:
+        return jsonify(e.payload), e.status
+
+    return jsonify(weather_info(location, weather)), 200, cache_headers(age, cache_status)
+
+
+# ============================================================================
+# BATCH WEATHER
+# ============================================================================
+
+# Dashboards show many cities at once. A batch resolves them on a shared pool
+# of BATCH_CONCURRENCY threads, so one large batch cannot flood the upstream,
+# and reuses both caches. Cache misses whose OpenWeatherMap city ID is known
+# from an earlier answer are fetched GROUP_MAX_IDS at a time with one group
+# call instead of one call per city.
+BATCH_MAX_CITIES = 50
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+GROUP_MAX_IDS = 20  # Upper limit of the group endpoint
+
+batch_executor = ThreadPoolExecutor(
+    max_workers=BATCH_CONCURRENCY,
+    thread_name_prefix='weather-batch',
+    # Batch lookups queue behind single /weather requests for the upstream quota
+    initializer=upstream_priority.set,
+    initargs=(PRIORITY_BATCH,)
+)
 
-    # Build the geocoding API URL with query and API key
-    geocoding_url = f'{GEOCODING_API_URL}?q={query}&appid={OPENWEATHER_API_KEY}&limit=1'
 
-    # Make request to Geocoding API
+def settle(fn, *args):
+    """Run fn, returning (result, None) or (None, UpstreamError)"""
     try:
-        # Make GET request to geocoding API
-        geo_response = requests.get(geocoding_url)
+        return fn(*args), None
+    except UpstreamError as e:
+        return None, e
 
-        # Check if the request was successful
-        if geo_response.status_code != 200:
-            return jsonify({
-                'error': 'Geocoding API request failed',
-                'status_code': geo_response.status_code,
-                'message': 'Could not connect to OpenWeatherMap Geocoding API'
-            }), 502
 
-        # Parse JSON response from geocoding API
-        geo_data = geo_response.json()
+def parse_batch_cities():
+    """
+    Read the requested cities as (city, country_code) pairs, either from
+    ?cities=Madrid,ES;Paris,FR or from a JSON body such as
+    {"cities": ["Madrid,ES", {"city": "Paris", "country": "FR"}]}.
+    Raises ValueError with a message for the client.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        entries = data.get('cities') if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            raise ValueError('Request body must be JSON with a "cities" list')
+    else:
+        entries = [entry for entry in request.args.get('cities', '').split(';') if entry.strip()]
 
-        # Check if city was found
-        if not geo_data or len(geo_data) == 0:
-            return jsonify({
-                'error': 'City not found',
-                'message': f'Could not find coordinates for city: {city}',
-                'suggestion': 'Try adding a country code, e.g., ?city=Paris&country=FR'
-            }), 404
+    cities = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            city, country_code = entry.get('city'), entry.get('country', '')
+        elif isinstance(entry, str):
+            city, _, country_code = entry.partition(',')
+        else:
+            city = country_code = None
+        if not isinstance(city, str) or not city.strip() or not isinstance(country_code, str):
+            raise ValueError(f'Invalid city entry: {entry!r}')
+        cities.append((city.strip(), country_code.strip()))
 
-        # Extract coordinates from first result
-        latitude = geo_data[0]['lat']
-        longitude = geo_data[0]['lon']
+    if not cities:
+        raise ValueError('No cities given, e.g. ?cities=Madrid,ES;Paris,FR')
+    if len(cities) > BATCH_MAX_CITIES:
+        raise ValueError(f'At most {BATCH_MAX_CITIES} cities per batch')
+    return cities
 
-        # Get additional location info
-        location_name = geo_data[0].get('name', city)
-        country = geo_data[0].get('country', 'Unknown')
-        state = geo_data[0].get('state', '')  # Some locations have state info
 
+def fetch_weather_group(city_ids):
+    """
+    Get current conditions for up to GROUP_MAX_IDS OpenWeatherMap city IDs
+    with one call. Returns {city_id: weather}; raises UpstreamError.
+    """
+    count('upstream_weather_group_calls')
+    try:
+        group_response = upstream_get(GROUP_API_URL, {
+            'id': ','.join(str(city_id) for city_id in city_ids),
+            'appid': OPENWEATHER_API_KEY,
+            'units': 'metric',
+            'lang': 'en'
+        }, weather_breaker)
     except requests.exceptions.RequestException as e:
-        return jsonify({
+        raise UpstreamError({
             'error': 'Network error',
-            'message': f'Could not connect to Geocoding API: {str(e)}'
-        }), 502
-    except (KeyError, IndexError, ValueError) as e:
-        return jsonify({
-            'error': 'Invalid response from Geocoding API',
+            'message': f'Could not connect to Weather API: {str(e)}'
+        })
+
+    try:
+        items = weather_response_data(group_response)['list']
+        return {item['id']: weather_from_data(item) for item in items}
+    except (KeyError, TypeError) as e:
+        raise UpstreamError({
+            'error': 'Invalid response from Weather API',
             'message': str(e)
-        }), 502
+        })
 
-    # ========================================================================
-    # STEP 2: Get weather data using coordinates
-    # ========================================================================
 
-    # Build the weather API URL with coordinates and API key
-    weather_url = f'{WEATHER_API_URL}?lat={latitude}&lon={longitude}&appid={OPENWEATHER_API_KEY}&units=metric&lang=en'
+def batch_weather(cities):
+    """Resolve and fetch weather for many cities; returns one result per city"""
+    # Step 1: resolve every city concurrently (mostly cache hits)
+    resolved = list(batch_executor.map(lambda city: settle(geocode, *city), cities))
+
+    # Step 2: serve cached weather, and sort misses into group and single calls
+    found = {}    # key -> ((weather, age, cache status), error)
+    groups = {}   # city ID -> [(key, location)]
+    singles = {}  # key -> location
+    seen = set()
+    for location, error in resolved:
+        if location is None or weather_cache_key(location) in seen:
+            continue
+        key = weather_cache_key(location)
+        seen.add(key)
+        record_request(key, location)
+        cached = peek_weather(key, location)
+        city_id = weather_city_ids.get(key)
+        if cached is not None:
+            found[key] = cached, None
+        elif city_id is not None:
+            groups.setdefault(city_id, []).append((key, location))
+        else:
+            singles[key] = location
+
+    # Step 3: fetch all misses concurrently
+    ids = list(groups)
+    chunks = [ids[i:i + GROUP_MAX_IDS] for i in range(0, len(ids), GROUP_MAX_IDS)]
+    group_jobs = [batch_executor.submit(settle, fetch_weather_group, chunk) for chunk in chunks]
+    single_jobs = {
+        key: batch_executor.submit(settle, load_or_last_weather, key, location)
+        for key, location in singles.items()
+    }
+    for chunk, job in zip(chunks, group_jobs):
+        weathers, _ = job.result()
+        for city_id in chunk:
+            for key, location in groups[city_id]:
+                if weathers and city_id in weathers:
+                    found[key] = (store_weather(key, weathers[city_id], city_id), 0, 'MISS'), None
+                else:
+                    # The group call failed or skipped this ID: ask for the location itself
+                    single_jobs[key] = batch_executor.submit(settle, load_or_last_weather, key, location)
+    for key, job in single_jobs.items():
+        found[key] = job.result()
+
+    # Step 4: one result per requested city, in request order
+    results = []
+    for (city, country_code), (location, error) in zip(cities, resolved):
+        result = {'query': {'city': city, 'country': country_code}}
+        if error is None and location is None:
+            error = UpstreamError(city_not_found(city), 404)
+        if error is None:
+            cached, error = found[weather_cache_key(location)]
+        if error is not None:
+            result.update(status=error.status, error=error.payload)
+        else:
+            weather, age, cache_status = cached
+            result.update(status=200, cache=cache_status, age=int(age), data=weather_info(location, weather))
+        results.append(result)
+    return results
+
+
+@app.route('/weather/batch', methods=['GET', 'POST'])
+def weather_batch():
+    """
+    Get weather information for many cities in one call - Public endpoint
+
+    GET  /weather/batch?cities=Madrid,ES;Paris,FR;Tokyo
+    POST /weather/batch  {"cities": ["Madrid,ES", {"city": "Paris", "country": "FR"}]}
+
+    Returns:
+        JSON with one result per city, in request order. Each result has its
+        own status, so one unknown city does not fail the whole batch.
+    """
+    if OPENWEATHER_API_KEY == 'YOUR_API_KEY_HERE':
+        return jsonify(API_KEY_NOT_CONFIGURED), 500
 
     try:
-        # Make GET request to weather API
-        weather_response = requests.get(weather_url)
+        cities = parse_batch_cities()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-        if weather_response.status_code != 200:
-            return jsonify({
-                'error': 'Weather API request failed',
-                'status_code': weather_response.status_code,
-                'message': 'Could not retrieve weather information'
-            }), 502
+    results = batch_weather(cities)
+    return jsonify({
+        'count': len(results),
+        'succeeded': sum(1 for result in results if result['status'] == 200),
+        'results': results
+    }), 200
 
-        # Parse JSON response from weather API
-        weather_data = weather_response.json()
 
-        # Extract relevant weather information
-        weather_info = {
-            'location': {
-                'city': location_name,
-                'country': country,
-                'state': state,
-                'coordinates': {
-                    'latitude': latitude,
-                    'longitude': longitude
-                }
-            },
-            'weather': {
-                'temperature': weather_data['main']['temp'],
-                'feels_like': weather_data['main']['feels_like'],
-                'humidity': weather_data['main']['humidity'],
-                'pressure': weather_data['main']['pressure'],
-                'description': weather_data['weather'][0]['description'],
-                'main': weather_data['weather'][0]['main'],
-                'icon': weather_data['weather'][0]['icon']
-            },
-            'wind': {
-                'speed': weather_data['wind']['speed'],
-                'direction': weather_data['wind'].get('deg', 'N/A')
-            },
-            'timestamp': weather_data['dt']
-        }
+# ============================================================================
+# POPULARITY PREFETCH
+# ============================================================================
+
+# The most requested locations would still miss (or go stale) once per TTL.
+# Requests are counted with a space-saving summary, which finds the heavy
+# hitters of an unbounded key stream in fixed memory, and a background thread
+# refreshes the PREFETCH_TOP_K most popular entries PREFETCH_LEAD seconds
+# before they expire. Prefetching only uses quota tokens that are spare at the
+# time and keeps PREFETCH_RESERVE_TOKENS for requests; entries with a known
+# city ID are refreshed GROUP_MAX_IDS per call. PREFETCH_TOP_K=0 disables it.
+PREFETCH_TOP_K = int(os.environ.get('PREFETCH_TOP_K', 50))
+PREFETCH_LEAD = float(os.environ.get('PREFETCH_LEAD', 60))
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', 5))
+PREFETCH_RESERVE_TOKENS = UPSTREAM_BURST / 2
+# Counters kept by the summary; more counters make the top-K more accurate
+POPULARITY_COUNTERS = max(1, PREFETCH_TOP_K) * 4
+# Counts are halved this often, so popularity follows the current traffic
+POPULARITY_HALF_LIFE = 300
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counts over a stream in O(1) per update (Metwally et
+    al., "Efficient Computation of Frequent and Top-k Elements in Data
+    Streams"). When all counters are taken, a new key replaces one with the
+    lowest count and inherits that count, so counts can only be overestimated,
+    by at most the inherited error.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}      # key -> count
+        self.errors = {}      # key -> overestimation
+        self.values = {}      # key -> latest value seen with it
+        self.buckets = {}     # count -> {key: None}, in arrival order
+        self.min_count = 0
+        self.lock = threading.Lock()
+
+    def move(self, key, old, new):
+        """Move key from the bucket for count `old` (0: none) to the one for `new`"""
+        if old:
+            bucket = self.buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[old]
+                if old == self.min_count:
+                    self.min_count = new
+        else:
+            self.min_count = new
+        self.buckets.setdefault(new, {})[key] = None
+        self.counts[key] = new
+
+    def add(self, key, value=None):
+        with self.lock:
+            count = self.counts.get(key)
+            if count is None:
+                if len(self.counts) < self.capacity:
+                    count = self.errors[key] = 0
+                else:
+                    # Take over the oldest counter with the lowest count
+                    count = self.min_count
+                    bucket = self.buckets[count]
+                    evicted = next(iter(bucket))
+                    del bucket[evicted]
+                    for table in (self.counts, self.errors, self.values):
+                        del table[evicted]
+                    bucket[key] = None
+                    self.counts[key] = self.errors[key] = count
+            self.values[key] = value
+            self.move(key, count, count + 1)
+
+    def top(self, k):
+        """[(key, value, count, error)] for the k largest counts, largest first"""
+        with self.lock:
+            result = []
+            for count in sorted(self.buckets, reverse=True):
+                for key in self.buckets[count]:
+                    result.append((key, self.values[key], count, self.errors[key]))
+                    if len(result) == k:
+                        return result
+            return result
+
+    def decay(self):
+        """Halve every count, forgetting keys that drop to zero"""
+        with self.lock:
+            self.buckets = {}
+            for key, count in list(self.counts.items()):
+                count //= 2
+                if count:
+                    self.counts[key] = count
+                    self.errors[key] //= 2
+                    self.buckets.setdefault(count, {})[key] = None
+                else:
+                    for table in (self.counts, self.errors, self.values):
+                        del table[key]
+            self.min_count = min(self.buckets, default=0)
+
+    def __len__(self):
+        return len(self.counts)
+
+
+popular_locations = SpaceSaving(POPULARITY_COUNTERS)
+prefetcher = None
+prefetcher_lock = threading.Lock()
+
+
+def record_request(key, location):
+    """Count a weather request for the prefetcher, starting it on first use"""
+    global prefetcher
+    if PREFETCH_TOP_K <= 0:
+        return
+    popular_locations.add(key, location)
+    if prefetcher is None:
+        with prefetcher_lock:
+            if prefetcher is None:
+                prefetcher = threading.Thread(target=prefetch_loop, name='weather-prefetch', daemon=True)
+                prefetcher.start()
+
+
+def due_for_prefetch():
+    """Popular (key, location) pairs whose weather expires within PREFETCH_LEAD seconds"""
+    due = []
+    for key, location, _, _ in popular_locations.top(PREFETCH_TOP_K):
+        entry = weather_cache.get(key)
+        if entry is not None and time.time() - entry[1] < WEATHER_CACHE_TTL - PREFETCH_LEAD:
+            continue
+        if start_refresh(key):
+            due.append((key, location))
+    return due
+
+
+def prefetch_weather(due):
+    """Refresh due entries while spare quota lasts; returns how many were fetched"""
+    groups = {}
+    singles = []
+    for key, location in due:
+        city_id = weather_city_ids.get(key)
+        if city_id is not None:
+            groups.setdefault(city_id, []).append((key, location))
+        else:
+            singles.append((key, location))
+    ids = list(groups)
+    calls = [('group', ids[i:i + GROUP_MAX_IDS]) for i in range(0, len(ids), GROUP_MAX_IDS)]
+    calls += [('single', entry) for entry in singles]
+
+    fetched = 0
+    try:
+        for kind, target in calls:
+            if upstream_quota.spare_tokens() < 1 + PREFETCH_RESERVE_TOKENS:
+                count('weather_prefetch_deferred')
+                break
+            try:
+                if kind == 'group':
+                    weathers = fetch_weather_group(target)
+                    for city_id, weather in weathers.items():
+                        for key, _ in groups.get(city_id, ()):
+                            store_weather(key, weather, city_id)
+                            fetched += 1
+                else:
+                    load_weather(*target)
+                    fetched += 1
+            except QuotaExceededError:
+                count('weather_prefetch_deferred')
+                break
+            except UpstreamError:
+                count('weather_prefetch_errors')
+    finally:
+        for key, _ in due:
+            finish_refresh(key)
+    count('weather_prefetches', fetched)
+    return fetched
+
+
+def prefetch_loop():
+    """Background thread: refresh popular entries just before they expire"""
+    upstream_priority.set(PRIORITY_BACKGROUND)
+    last_decay = time.monotonic()
+    while True:
+        time.sleep(PREFETCH_INTERVAL)
+        if time.monotonic() - last_decay >= POPULARITY_HALF_LIFE:
+            popular_locations.decay()
+            last_decay = time.monotonic()
+        try:
+            prefetch_weather(due_for_prefetch())
+        except Exception:  # never let one bad cycle stop prefetching
+            count('weather_prefetch_errors')
+
+
+# ============================================================================
+# WEATHER FORECAST
+# ============================================================================
+
+# The 5 day forecast has 40 three-hourly slots, far more than a client that
+# wants "min, max and average per day" needs. The forecast is fetched once
+# per geohash cell (like current weather) and cached as NumPy arrays for
+# FORECAST_CACHE_TTL seconds, since it only changes every few hours. Daily
+# summaries for every requested city are then computed together: all slots
+# are concatenated, grouped by (city, local day) and each statistic is one
+# grouped array operation, with no Python loop over slots or days.
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for /weather/forecast
+    np = None
+
+FORECAST_CACHE_TTL = int(os.environ.get('FORECAST_CACHE_TTL', 1800))
+FORECAST_MAX_DAYS = 5
+FORECAST_PERCENTILES = (10, 90)
+# Labels for the values in each units system; forecasts are fetched in metric
+FORECAST_UNITS = {
+    'metric': {'temperature': '°C', 'wind_speed': 'm/s', 'precipitation': 'mm'},
+    'imperial': {'temperature': '°F', 'wind_speed': 'mph', 'precipitation': 'mm'},
+    'standard': {'temperature': 'K', 'wind_speed': 'm/s', 'precipitation': 'mm'},
+}
 
-        return jsonify(weather_info), 200
+forecast_cache = LRUCache(WEATHER_CACHE_SIZE)
+forecast_flight = SingleFlight('forecast')
 
+
+def forecast_arrays(forecast_data):
+    """The columns of a Forecast API answer that summaries need, as arrays"""
+    slots = forecast_data['list']
+
+    def column(field, dtype=float):
+        return np.fromiter((field(slot) for slot in slots), dtype=dtype, count=len(slots))
+
+    return {
+        'dt': column(lambda slot: slot['dt'], np.int64),
+        'temp': column(lambda slot: slot['main']['temp']),
+        'humidity': column(lambda slot: slot['main']['humidity']),
+        'wind_speed': column(lambda slot: slot['wind']['speed']),
+        'pop': column(lambda slot: slot.get('pop', 0)),
+        'rain': column(lambda slot: slot.get('rain', {}).get('3h', 0)),
+        'timezone': forecast_data['city'].get('timezone', 0)
+    }
+
+
+def fetch_forecast(location):
+    """Get the forecast arrays for a location; raises UpstreamError"""
+    count('upstream_forecast_calls')
+    try:
+        forecast_response = upstream_get(FORECAST_API_URL, {
+            'lat': location['lat'],
+            'lon': location['lon'],
+            'appid': OPENWEATHER_API_KEY,
+            'units': 'metric'
+        }, weather_breaker)
     except requests.exceptions.RequestException as e:
+        raise UpstreamError({
+            'error': 'Network error',
+            'message': f'Could not connect to Forecast API: {str(e)}'
+        })
+
+    forecast_data = weather_response_data(forecast_response)
+    try:
+        return forecast_arrays(forecast_data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise UpstreamError({
+            'error': 'Invalid response from Forecast API',
+            'message': str(e)
+        })
+
+
+def cached_forecast(location):
+    """Forecast arrays for a location, from the cache when fresh enough"""
+    key = weather_cache_key(location)
+    entry = forecast_cache.get(key)
+    if entry is not None and time.time() - entry[1] < FORECAST_CACHE_TTL:
+        count('forecast_cache_hits')
+        return entry[0]
+    count('forecast_cache_misses')
+
+    def load():
+        arrays = fetch_forecast(location)
+        forecast_cache.set(key, (arrays, time.time()))
+        return arrays
+
+    try:
+        return forecast_flight.do(key, load)
+    except UpstreamError:
+        if entry is None:
+            raise
+        count('forecast_cache_fallbacks')
+        return entry[0]
+
+
+def convert_temperatures(celsius, units):
+    if units == 'imperial':
+        return celsius * 9 / 5 + 32
+    if units == 'standard':
+        return celsius + 273.15
+    return celsius
+
+
+def convert_speeds(meters_per_second, units):
+    return meters_per_second * 2.236936 if units == 'imperial' else meters_per_second
+
+
+def daily_summaries(forecasts, units, days=FORECAST_MAX_DAYS):
+    """
+    Per local day aggregates for several forecasts at once. Returns one list
+    of day summaries per forecast, in the same order (empty for a forecast
+    without slots).
+    """
+    sizes = [len(arrays['dt']) for arrays in forecasts]
+    if not sum(sizes):
+        return [[] for _ in forecasts]
+    owner = np.repeat(np.arange(len(forecasts)), sizes)
+    offsets = np.repeat([arrays['timezone'] for arrays in forecasts], sizes)
+    day = (np.concatenate([arrays['dt'] for arrays in forecasts]) + offsets) // 86400
+
+    def column(name):
+        return np.concatenate([arrays[name] for arrays in forecasts])
+
+    # One group per (forecast, day), sorted by temperature inside each group
+    # so min, max and percentiles can be read off by position
+    temp = column('temp')
+    order = np.lexsort((temp, day, owner))
+    owner, day, temp = owner[order], day[order], temp[order]
+    starts = np.flatnonzero(np.r_[True, (np.diff(owner) != 0) | (np.diff(day) != 0)])
+    slots = np.diff(np.r_[starts, len(temp)])
+
+    # Linear interpolation between the closest ranks, like np.percentile
+    ranks = (slots[:, None] - 1) * (np.array(FORECAST_PERCENTILES) / 100)
+    below = np.floor(ranks).astype(np.int64)
+    above = np.ceil(ranks).astype(np.int64)
+    low, high = temp[starts[:, None] + below], temp[starts[:, None] + above]
+    percentiles = low + (high - low) * (ranks - below)
+
+    # Temperature and speed conversions are linear, so they are applied to
+    # the aggregates rather than to every slot
+    temperatures = convert_temperatures(np.column_stack([
+        temp[starts],
+        temp[starts + slots - 1],
+        np.add.reduceat(temp, starts) / slots,
+        percentiles
+    ]), units).round(2).tolist()
+    humidity = (np.add.reduceat(column('humidity')[order], starts) / slots).round(1).tolist()
+    wind_speed = convert_speeds(np.maximum.reduceat(column('wind_speed')[order], starts), units).round(2).tolist()
+    pop = np.maximum.reduceat(column('pop')[order], starts).round(2).tolist()
+    rain = np.add.reduceat(column('rain')[order], starts).round(2).tolist()
+    dates = day[starts].astype('datetime64[D]').astype(str).tolist()
+
+    summaries = [[] for _ in forecasts]
+    for group, forecast_index in enumerate(owner[starts].tolist()):
+        if len(summaries[forecast_index]) == days:
+            continue
+        minimum, maximum, mean, *quantiles = temperatures[group]
+        summaries[forecast_index].append({
+            'date': dates[group],
+            'slots': int(slots[group]),
+            'temperature': {
+                'min': minimum,
+                'max': maximum,
+                'mean': round(mean, 2),
+                **{f'p{q}': value for q, value in zip(FORECAST_PERCENTILES, quantiles)}
+            },
+            'humidity_mean': humidity[group],
+            'wind_speed_max': wind_speed[group],
+            'precipitation': {'probability_max': pop[group], 'total': rain[group]}
+        })
+    return summaries
+
+
+def forecast_info(location, summary, units):
+    return {'location': location_info(location), 'units': FORECAST_UNITS[units], 'days': summary}
+
+
+def parse_forecast_options():
+    """(units, days) from the query string; raises ValueError"""
+    units = request.args.get('units', 'metric')
+    if units not in FORECAST_UNITS:
+        raise ValueError(f'units must be one of {", ".join(FORECAST_UNITS)}')
+    try:
+        days = int(request.args.get('days', FORECAST_MAX_DAYS))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= FORECAST_MAX_DAYS:
+        raise ValueError(f'days must be a number from 1 to {FORECAST_MAX_DAYS}')
+    return units, days
+
+
+def batch_forecast(cities, units, days):
+    """Resolve and summarize the forecast for many cities; one result per city"""
+    resolved = list(batch_executor.map(lambda city: settle(geocode, *city), cities))
+    jobs = {}
+    for location, error in resolved:
+        if location is not None and weather_cache_key(location) not in jobs:
+            jobs[weather_cache_key(location)] = batch_executor.submit(settle, cached_forecast, location)
+    fetched = {key: job.result() for key, job in jobs.items()}
+
+    # Summaries for all cities that have a forecast, in one vectorized pass
+    keys = [key for key, (arrays, error) in fetched.items() if error is None]
+    summaries = dict(zip(keys, daily_summaries([fetched[key][0] for key in keys], units, days))) if keys else {}
+
+    results = []
+    for (city, country_code), (location, error) in zip(cities, resolved):
+        result = {'query': {'city': city, 'country': country_code}}
+        if error is None and location is None:
+            error = UpstreamError(city_not_found(city), 404)
+        if error is None:
+            error = fetched[weather_cache_key(location)][1]
+        if error is not None:
+            result.update(status=error.status, error=error.payload)
+        else:
+            result.update(status=200, data=forecast_info(
+                location, summaries[weather_cache_key(location)], units))
+        results.append(result)
+    return results
+
+
+@app.route('/weather/forecast', methods=['GET', 'POST'])
+def weather_forecast():
+    """
+    Daily forecast summary for the next days - Public endpoint
+
+    GET  /weather/forecast?city=Madrid&country=ES&units=metric&days=5
+    GET  /weather/forecast?cities=Madrid,ES;Paris,FR
+    POST /weather/forecast  {"cities": ["Madrid,ES", {"city": "Paris", "country": "FR"}]}
+
+    Returns:
+        JSON with min, max, mean and percentile temperatures, mean humidity,
+        maximum wind speed and precipitation per local day. With several
+        cities, one result per city in request order, like /weather/batch.
+    """
+    if np is None:
+        return jsonify({
+            'error': 'Forecast not available',
+            'message': 'Install numpy to enable /weather/forecast'
+        }), 501
+    if OPENWEATHER_API_KEY == 'YOUR_API_KEY_HERE':
+        return jsonify(API_KEY_NOT_CONFIGURED), 500
+
+    try:
+        units, days = parse_forecast_options()
+        cities = parse_batch_cities() if request.method == 'POST' or 'cities' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if cities is not None:
+        results = batch_forecast(cities, units, days)
         return jsonify({
+            'count': len(results),
+            'succeeded': sum(1 for result in results if result['status'] == 200),
+            'results': results
+        }), 200
+
+    city = request.args.get('city', 'Madrid')
+    try:
+        location = geocode(city, request.args.get('country', ''))
+        if location is None:
+            return jsonify(city_not_found(city)), 404
+        arrays = cached_forecast(location)
+    except UpstreamError as e:
+        return jsonify(e.payload), e.status
+
+    summary, = daily_summaries([arrays], units, days)
+    return jsonify(forecast_info(location, summary, units)), 200
+
+
+# ============================================================================
+# MONITORING
+# ============================================================================
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Counters and cache hit rates - Public endpoint"""
+    with metrics_lock:
+        counters = dict(metrics)
+
+    return jsonify({
+        'counters': counters,
+        'geocode_cache': {
+            'memory_entries': len(geocode_memory),
+            'gazetteer_entries': len(gazetteer) if gazetteer is not None else 0,
+            'hit_rate': hit_rate(
+                counters,
+                ('geocode_cache_memory_hits', 'geocode_gazetteer_hits', 'geocode_cache_disk_hits'),
+                ('geocode_cache_misses',)
+            )
+        },
+        'weather_cache': {
+            'entries': len(weather_cache),
+            'geohash_precision': WEATHER_GEOHASH_PRECISION,
+            'evictions': weather_cache.evictions,
+            'refreshing': len(refreshing),
+            'hit_rate': hit_rate(
+                counters,
+                ('weather_cache_hits', 'weather_cache_stale_hits'),
+                ('weather_cache_misses',)
+            )
+        },
+        'forecast_cache': {
+            'entries': len(forecast_cache),
+            'hit_rate': hit_rate(counters, ('forecast_cache_hits',), ('forecast_cache_misses',))
+        },
+        'circuit_breakers': {
+            breaker.name: breaker.snapshot()
+            for breaker in (geocoding_breaker, weather_breaker)
+        },
+        'upstream_quota': upstream_quota.snapshot(),
+        'hedging': {name: policy.snapshot() for name, policy in hedge_policies.items()},
+        'prefetch': {
+            'tracked_locations': len(popular_locations),
+            'top': [
+                {'city': location['name'], 'country': location['country'], 'requests': requests_seen}
+                for _, location, requests_seen, _ in popular_locations.top(10)
+            ]
+        }
+    }), 200
+
+
+# ============================================================================
+# ASYNC WEATHER ENDPOINT (ASGI)
+# ============================================================================
+
+# Served with an ASGI server (uvicorn example07:asgi_app), GET /weather runs
+# on an event loop with a non-blocking httpx client: one worker keeps many
+# slow OpenWeatherMap calls in flight instead of parking a thread on each.
+# Caches, coalescing and metrics are shared with the Flask endpoint, and
+# every other route is still served by the Flask app through WsgiToAsgi.
+try:
+    import httpx
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # httpx/asgiref are only needed for the ASGI entry point
+    httpx = None
+
+# Upper bound on upstream calls in flight from one worker; further calls
+# wait on a semaphore. Connections are spread over several small httpx pools
+# because httpcore rescans a pool's connections for every queued request,
+# which turns CPU-bound well before the upstream does with one large pool.
+ASYNC_UPSTREAM_CONCURRENCY = int(os.environ.get('ASYNC_UPSTREAM_CONCURRENCY', 128))
+ASYNC_POOL_SIZE = 16
+
+async_clients = []
+async_client_turn = 0
+async_upstream_slots = None
+background_tasks = set()
+
+
+def next_async_client():
+    """The httpx pools are used in turn"""
+    global async_client_turn
+    async_client_turn = (async_client_turn + 1) % len(async_clients)
+    return async_clients[async_client_turn]
+
+
+async def async_upstream_get(url, params, breaker):
+    """GET through the shared httpx pools, created inside the event loop"""
+    global async_upstream_slots
+    if not async_clients:
+        async_upstream_slots = asyncio.Semaphore(ASYNC_UPSTREAM_CONCURRENCY)
+        for _ in range(-(-ASYNC_UPSTREAM_CONCURRENCY // ASYNC_POOL_SIZE)):
+            async_clients.append(httpx.AsyncClient(
+                timeout=httpx.Timeout(UPSTREAM_TIMEOUT[1], connect=UPSTREAM_TIMEOUT[0]),
+                # retries= re-attempts failed connections, like UPSTREAM_RETRIES
+                transport=httpx.AsyncHTTPTransport(
+                    retries=2,
+                    limits=httpx.Limits(
+                        max_connections=ASYNC_POOL_SIZE,
+                        max_keepalive_connections=ASYNC_POOL_SIZE
+                    )
+                )
+            ))
+
+    trial = breaker.before_call()
+    try:
+        await upstream_quota.acquire_async()
+    except (QuotaExceededError, asyncio.CancelledError):
+        breaker.release(trial)
+        raise
+    async with async_upstream_slots:
+        try:
+            response = await hedged_get_async(
+                lambda target, query: next_async_client().get(target, params=query),
+                url, params, hedge_policies[breaker.name]
+            )
+        except httpx.HTTPError:
+            breaker.record_failure()
+            raise
+    breaker.record_response(response.status_code, trial)
+    check_throttled(response)
+    return response
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent callers await one task per key"""
+
+    def __init__(self, name):
+        self.name = name
+        self.tasks = {}
+
+    async def do(self, key, fn):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.tasks[key] = task
+            task.add_done_callback(lambda done: self.tasks.pop(key, None))
+        else:
+            count(f'{self.name}_coalesced')
+        # A cancelled caller must not cancel the call other callers wait on
+        return await asyncio.shield(task)
+
+
+async_geocode_flight = AsyncSingleFlight('geocode')
+async_weather_flight = AsyncSingleFlight('weather')
+
+
+async def fetch_location_async(city, country_code):
+    """Async fetch_location()"""
+    count('upstream_geocode_calls')
+    try:
+        geo_response = await async_upstream_get(
+            GEOCODING_API_URL, geocoding_params(city, country_code), geocoding_breaker)
+    except httpx.HTTPError as e:
+        raise UpstreamError({
+            'error': 'Network error',
+            'message': f'Could not connect to Geocoding API: {str(e)}'
+        })
+    return parse_location(geo_response, city)
+
+
+async def geocode_async(city, country_code=''):
+    """
+    Async geocode(). Memory and gazetteer lookups stay inline; the SQLite
+    cache is read and written in a worker thread, so a miss never blocks
+    the event loop on disk I/O or on the store's lock.
+    """
+    key = normalize_location_key(city, country_code)
+    found, location = memory_location(key, time.time())
+    if found:
+        return location
+
+    async def resolve():
+        found, location = await asyncio.to_thread(disk_location, key, time.time())
+        if found:
+            return location
+        location = await fetch_location_async(city, country_code)
+        return await asyncio.to_thread(store_location, key, location)
+
+    return await async_geocode_flight.do(key, resolve)
+
+
+async def fetch_weather_async(location):
+    """Async fetch_weather()"""
+    count('upstream_weather_calls')
+    try:
+        weather_response = await async_upstream_get(
+            WEATHER_API_URL, weather_params(location), weather_breaker)
+    except httpx.HTTPError as e:
+        raise UpstreamError({
             'error': 'Network error',
             'message': f'Could not connect to Weather API: {str(e)}'
-        }), 502
-    except (KeyError, ValueError) as e:
-        return jsonify({
-            'error': 'Invalid response from Weather API',
-            'message': str(e)
-        }), 502
+        })
+    return parse_weather(weather_response)
+
+
+async def load_weather_async(key, location):
+    async def load():
+        return store_weather(key, *await fetch_weather_async(location))
+
+    return await async_weather_flight.do(key, load)
+
+
+async def refresh_weather_async(key, location):
+    """Async refresh_weather(), run as a background task"""
+    upstream_priority.set(PRIORITY_BACKGROUND)
+    try:
+        await load_weather_async(key, location)
+        count('weather_cache_refreshes')
+    except UpstreamError:
+        count('weather_cache_refresh_errors')
+    finally:
+        finish_refresh(key)
+
+
+async def cached_weather_async(location):
+    """Async cached_weather()"""
+    key = weather_cache_key(location)
+    record_request(key, location)
+    cached = lookup_weather(key)
+
+    if cached is not None:
+        if cached[2] == 'STALE' and start_refresh(key):
+            # Keep a reference so the task is not garbage collected mid-flight
+            task = asyncio.ensure_future(refresh_weather_async(key, location))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        return cached
+
+    try:
+        return await load_weather_async(key, location), 0, 'MISS'
+    except UpstreamError:
+        fallback = last_weather(key)
+        if fallback is None:
+            raise
+        count('weather_cache_fallbacks')
+        return fallback
+
+
+async def weather_async(args):
+    """
+    Same contract as GET /weather: returns (status, body, extra headers).
+    """
+    city = args.get('city', 'Madrid')
+    country_code = args.get('country', '')
+
+    if OPENWEATHER_API_KEY == 'YOUR_API_KEY_HERE':
+        return 500, API_KEY_NOT_CONFIGURED, {}
+
+    try:
+        location = await geocode_async(city, country_code)
+        if location is None:
+            return 404, city_not_found(city), {}
+        weather, age, cache_status = await cached_weather_async(location)
+    except UpstreamError as e:
+        return e.status, e.payload, {}
+
+    return 200, weather_info(location, weather), cache_headers(age, cache_status)
+
+
+flask_asgi = WsgiToAsgi(app) if httpx is not None else None
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI entry point: async GET /weather, everything else via Flask"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for client in async_clients:
+                    await client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] == 'http' and scope['path'] == '/weather' and scope['method'] == 'GET':
+        # First value per name, like Flask's request.args
+        query = parse_qs(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        args = {name: values[0] for name, values in query.items()}
+        status, body, headers = await weather_async(args)
+
+        # Serialized exactly like jsonify()
+        payload = (app.json.dumps(body, separators=(',', ':')) + '\n').encode()
+        headers = {
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(payload)),
+            **headers
+        }
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+        return
+
+    await flask_asgi(scope, receive, send)
 
 
 # ============================================================================
@@ -274,11 +2528,15 @@ if __name__ == '__main__':
     print("  GET  /profile   - Get user profile (requires JWT)")
     print("\nWeather endpoint (public - no auth required):")
     print("  GET  /weather?city=CityName&country=CountryCode")
+    print("  GET  /weather/batch?cities=Madrid,ES;Paris,FR  (or POST a JSON list)")
+    print("\nMonitoring:")
+    print("  GET  /metrics   - Cache hit rates, counters and circuit breakers")
     print("\nExamples:")
     print("  curl http://127.0.0.1:5000/weather?city=Madrid")
     print("  curl http://127.0.0.1:5000/weather?city=Paris&country=FR")
     print("  curl http://127.0.0.1:5000/weather?city=London&country=GB")
     print("\nServer running at: http://127.0.0.1:5000")
+    print("Async server (concurrent upstream calls): uvicorn example07:asgi_app")
     print("="*70 + "\n")
 
     app.run(debug=True)
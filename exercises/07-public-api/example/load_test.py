@@ -0,0 +1,351 @@
+"""
+Load test for the weather endpoint against the local OpenWeatherMap stub.
+
+Starts openweather_stub.py and example07.py on free ports, sends GET
+/weather requests for a skewed mix of cities from many concurrent clients,
+and prints throughput, latency percentiles, cache results and how many
+upstream calls reached the stub. Nothing touches the real API.
+
+    python load_test.py                              # threaded Flask server
+    python load_test.py --server flask-single        # one request at a time
+    python load_test.py --server asgi                # uvicorn example07:asgi_app
+    python load_test.py --latency fixed:0.3 --error-rate 0.05 --requests 5000
+    python load_test.py --target http://127.0.0.1:5000   # an app you started
+    python load_test.py --log data/query_log_sample.txt  # replay recorded requests
+    python load_test.py --calls-per-minute 120 --quota 120   # app paces itself
+    python load_test.py --burst 500 --latency fixed:0.3      # coalescing check
+
+--burst N sends N simultaneous requests for each of --burst-cities cities
+the gazetteer does not know, and exits with status 1 unless the stub saw
+exactly one geocoding call and one weather call per city.
+
+With --target the app is not started; point it at a stub yourself (see
+openweather_stub.py). Standard library only, except uvicorn for --server asgi.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack
+from urllib.parse import quote, urlsplit
+
+EXAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The stub knows these; further cities get made-up coordinates
+POPULAR_CITIES = (
+    'Madrid', 'London', 'Paris', 'New York', 'Tokyo', 'Berlin', 'Rome',
+    'Barcelona', 'Lisbon', 'Sydney', 'Mexico City', 'Cairo',
+)
+
+# Requests for this many most requested paths are also reported on their own
+POPULAR_PATHS = 50
+
+# The request in an access log line, as written by the Flask development server
+ACCESS_LOG_REQUEST = re.compile(r'"GET (\S+) HTTP/[\d.]+"')
+
+SERVERS = {
+    # Werkzeug's development server, one thread per request (app.run default)
+    'flask': lambda port: [sys.executable, '-c', f'import example07; example07.app.run(port={port}, threaded=True)'],
+    # One request at a time, like a single sync worker
+    'flask-single': lambda port: [sys.executable, '-c', f'import example07; example07.app.run(port={port}, threaded=False)'],
+    # Async /weather on one event loop (see the ASGI section of example07.py)
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'example07:asgi_app', '--port', str(port),
+                          '--log-level', 'warning', '--backlog', '2048'],
+}
+
+
+# ============================================================================
+# PROCESSES
+# ============================================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'{process.args[1]} exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f'Nothing is listening on port {port} after {timeout}s')
+
+
+def start(stack, command, port, env=None):
+    """Start a process that is terminated when the stack closes"""
+    process = subprocess.Popen(
+        command, cwd=EXAMPLE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    stack.callback(process.wait, timeout=10)
+    stack.callback(process.terminate)
+    wait_for_port(port, process)
+    return process
+
+
+# ============================================================================
+# HTTP CLIENT
+# ============================================================================
+
+class Connection:
+    """A minimal HTTP/1.1 keep-alive client connection (no pool, no overhead)"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        """Return (status, headers, body); reconnects when the server closed"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n'.encode())
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+        if version == b'HTTP/1.0' or headers.get('connection', '').lower() == 'close' \
+                or 'content-length' not in headers:
+            self.close()
+        return int(status), headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def fetch_json(host, port, path):
+    connection = Connection(host, port)
+    try:
+        status, _, body = await connection.get(path)
+        return json.loads(body) if status == 200 else None
+    finally:
+        connection.close()
+
+
+# ============================================================================
+# LOAD
+# ============================================================================
+
+def city_mix(count, cities, zipf, seed):
+    """`count` city names where popularity follows 1/rank**zipf"""
+    names = list(POPULAR_CITIES[:cities]) + [f'Town{i}' for i in range(cities - len(POPULAR_CITIES))]
+    weights = [1 / rank ** zipf for rank in range(1, len(names) + 1)]
+    return random.Random(seed).choices(names, weights=weights, k=count)
+
+
+def read_log(path):
+    """Request paths from an access log, or from a file with one path per line"""
+    paths = []
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            line = line.strip()
+            match = ACCESS_LOG_REQUEST.search(line)
+            if match:
+                paths.append(match.group(1))
+            elif line.startswith('/'):
+                paths.append(line)
+    if not paths:
+        raise SystemExit(f'No GET requests found in {path}')
+    return paths
+
+
+async def run_load(host, port, paths, concurrency):
+    """Send every path from `concurrency` keep-alive clients; returns per-request results"""
+    results = []
+    queue = iter(paths)
+
+    async def client():
+        connection = Connection(host, port)
+        for path in queue:
+            started = time.perf_counter()
+            try:
+                status, headers, _ = await connection.get(path)
+                cache = headers.get('x-cache', '-')
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                connection.close()
+                status, cache = 'error', '-'
+            results.append((time.perf_counter() - started, status, cache, path))
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def burst_paths(size, cities, seed):
+    """`size` requests for each of `cities` cities, all sent at once in a shuffled order"""
+    paths = [f'/weather?city=Burst{seed}x{i}' for i in range(cities) for _ in range(size)]
+    random.Random(seed).shuffle(paths)
+    return paths
+
+
+def check_coalescing(key_calls, cities):
+    """Problems found in the stub's per-key counts after a burst (empty when coalescing worked)"""
+    problems = []
+    for endpoint in ('geocoding', 'weather'):
+        calls = key_calls.get(endpoint, {})
+        if len(calls) != cities:
+            problems.append(f'{endpoint}: {len(calls)} distinct keys called, expected {cities}')
+        problems += [f'{endpoint}: {n} calls for {key}' for key, n in sorted(calls.items()) if n != 1]
+    return problems
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report(args, server, results, elapsed, stub_stats, app_metrics):
+    latencies = sorted(latency for latency, _, _, _ in results)
+    statuses = Counter(status for _, status, _, _ in results)
+    caches = Counter(cache for _, _, cache, _ in results)
+    popular = {path for path, _ in Counter(path for _, _, _, path in results).most_common(POPULAR_PATHS)}
+    popular_caches = Counter(cache for _, _, cache, path in results if path in popular)
+
+    def ms(value):
+        return f'{value * 1000:.0f} ms'
+
+    print(f'Server:      {server}')
+    print(f'Upstream:    latency {args.latency_spec}, error rate {args.error_rate}, '
+          f'throttle rate {args.throttle_rate}, calls/min {args.calls_per_minute or "unlimited"}, '
+          f'app quota {args.quota or "unlimited"}')
+    if args.log:
+        print(f'Requests:    {len(results)} at concurrency {args.concurrency} replayed from {args.log}')
+    elif args.burst:
+        print(f'Requests:    {len(results)} at once, {args.burst} for each of {args.burst_cities} cities')
+    else:
+        print(f'Requests:    {len(results)} at concurrency {args.concurrency} '
+              f'over {args.cities} cities (zipf {args.zipf})')
+    print(f'Throughput:  {len(results) / elapsed:.1f} req/s in {elapsed:.2f} s')
+    print(f'Latency:     p50 {ms(percentile(latencies, 0.5))}  p90 {ms(percentile(latencies, 0.9))}  '
+          f'p99 {ms(percentile(latencies, 0.99))}  max {ms(latencies[-1])}')
+    print('Status:      ' + '  '.join(f'{status}: {n}' for status, n in sorted(statuses.items(), key=str)))
+    print('X-Cache:     ' + '  '.join(f'{cache}: {n}' for cache, n in sorted(caches.items())))
+    print(f'  top {POPULAR_PATHS}:    ' + '  '.join(f'{cache}: {n}' for cache, n in sorted(popular_caches.items())))
+    if stub_stats is not None:
+        print('Stub calls:  ' + '  '.join(f'{name}: {n}' for name, n in sorted(stub_stats.items())))
+    if app_metrics is not None:
+        breakers = app_metrics.get('circuit_breakers', {})
+        print('Breakers:    ' + '  '.join(f'{name}: {state["state"]}' for name, state in breakers.items()))
+        quota = app_metrics.get('upstream_quota', {})
+        counters = app_metrics.get('counters', {})
+        print(f'Quota:       {quota.get("used_last_minute")} calls in the last minute, '
+              f'{counters.get("upstream_throttled", 0)} throttled, ' + '  '.join(
+                  f'{name[6:]}: {n}' for name, n in sorted(counters.items()) if name.startswith('quota_')))
+        hedges = {name[6:]: n for name, n in sorted(counters.items()) if name.startswith('hedge_')}
+        if hedges:
+            delays = {name: policy['delay_ms'] for name, policy in app_metrics.get('hedging', {}).items()}
+            print('Hedging:     ' + '  '.join(f'{name}: {n}' for name, n in hedges.items())
+                  + f'  (delay ms {delays})')
+        weather_cache = app_metrics.get('weather_cache', {})
+        print(f'Weather:     {weather_cache.get("entries")} cache entries, '
+              f'hit rate {weather_cache.get("hit_rate")}, geohash precision {weather_cache.get("geohash_precision")}, '
+              f'{counters.get("weather_prefetches", 0)} prefetched')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test GET /weather against the OpenWeatherMap stub')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='flask')
+    parser.add_argument('--target', help='URL of an already running app (skips starting the app and stub)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--cities', type=int, default=200, help='distinct cities in the mix')
+    parser.add_argument('--zipf', type=float, default=1.1, help='popularity skew; 0 for uniform')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--log', help='replay the GET requests of this access log instead of a city mix')
+    parser.add_argument('--latency', dest='latency_spec', default='lognormal:0.1,0.4',
+                        help='stub latency distribution (see openweather_stub.py)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--calls-per-minute', type=int, default=0, help='stub quota; 429 beyond it')
+    parser.add_argument('--quota', type=int, default=0,
+                        help="the app's UPSTREAM_CALLS_PER_MINUTE; 0 for unlimited")
+    parser.add_argument('--burst', type=int, default=0,
+                        help='send this many simultaneous requests per city and check that they coalesce')
+    parser.add_argument('--burst-cities', type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.burst and args.target:
+        parser.error('--burst counts calls at the stub, so it cannot be used with --target')
+
+    if args.burst:
+        paths = burst_paths(args.burst, args.burst_cities, args.seed)
+        args.concurrency = len(paths)
+    elif args.log:
+        paths = read_log(args.log)
+    else:
+        paths = [f'/weather?city={quote(city)}'
+                 for city in city_mix(args.requests, args.cities, args.zipf, args.seed)]
+
+    with ExitStack() as stack:
+        if args.target:
+            target = urlsplit(args.target)
+            host, port, server, stub_port = target.hostname, target.port or 80, args.target, None
+        else:
+            host, port, stub_port = '127.0.0.1', free_port(), free_port()
+            start(stack, [
+                sys.executable, 'openweather_stub.py', '--port', str(stub_port),
+                '--latency', args.latency_spec, '--error-rate', str(args.error_rate),
+                '--throttle-rate', str(args.throttle_rate),
+                '--calls-per-minute', str(args.calls_per_minute), '--seed', str(args.seed)
+            ], stub_port)
+
+            # A fresh geocoding cache file per run, so every run starts cold
+            cache_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            env = dict(
+                os.environ,
+                OPENWEATHER_BASE_URL=f'http://127.0.0.1:{stub_port}',
+                OPENWEATHER_API_KEY='stub-key',
+                GEOCODE_CACHE_PATH=os.path.join(cache_dir, 'geocode.sqlite3'),
+                UPSTREAM_CALLS_PER_MINUTE=str(args.quota),
+            )
+            start(stack, SERVERS[args.server](port), port, env)
+            server = args.server
+
+        results, elapsed = asyncio.run(run_load(host, port, paths, args.concurrency))
+        stub_stats = asyncio.run(fetch_json('127.0.0.1', stub_port, '/stats')) if stub_port else None
+        key_calls = asyncio.run(fetch_json('127.0.0.1', stub_port, '/stats/keys')) if args.burst else None
+        app_metrics = asyncio.run(fetch_json(host, port, '/metrics'))
+
+    report(args, server, results, elapsed, stub_stats, app_metrics)
+
+    if args.burst:
+        problems = check_coalescing(key_calls, args.burst_cities)
+        failed = sum(1 for _, status, _, _ in results if status != 200)
+        if failed:
+            problems.append(f'{failed} requests did not get 200')
+        if problems:
+            print('Coalescing:  FAILED\n  ' + '\n  '.join(problems))
+            sys.exit(1)
+        print(f'Coalescing:  OK, one geocoding and one weather call for each of {args.burst_cities} cities')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,452 @@
+"""
+OpenWeatherMap stand-in server for offline development and load testing.
+
+Implements the endpoints example07.py uses, with payloads shaped like
+the real ones:
+
+    GET /geo/1.0/direct?q=City,CC&limit=1&appid=...
+    GET /data/2.5/weather?lat=..&lon=..&units=metric&appid=...
+    GET /data/2.5/group?id=1,2,3&units=metric&appid=...
+    GET /data/2.5/forecast?lat=..&lon=..&units=metric&appid=...
+
+plus GET /stats with call counters and GET /stats/keys with the calls made
+for each city name (geocoding) and coordinates (weather, forecast). Known cities get their real coordinates;
+any other name resolves to stable made-up coordinates, except names that
+start with "invalid", which are not found. Weather values are made up too,
+but stable for a location within a 10 minute window.
+
+Latency, server errors and rate limiting are configurable, so caching,
+retries and circuit breakers can be exercised without touching the real
+API or its quota:
+
+    python openweather_stub.py --port 8090 --latency lognormal:0.15,0.5 \\
+        --error-rate 0.01 --throttle-rate 0.01 --calls-per-minute 600
+
+Point the app at it, with its own geocoding cache so made-up coordinates
+stay out of the one used with the real API:
+
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8090 OPENWEATHER_API_KEY=stub \\
+        GEOCODE_CACHE_PATH=instance/geocode_stub.sqlite3 python example07.py
+
+Standard library only, so it runs in any environment the app runs in.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs, urlsplit
+
+
+# ============================================================================
+# FAKE DATA
+# ============================================================================
+
+# name: (lat, lon, country, state)
+KNOWN_CITIES = {
+    'madrid': (40.4167, -3.7033, 'ES', 'Community of Madrid'),
+    'barcelona': (41.3828, 2.1769, 'ES', 'Catalonia'),
+    'paris': (48.8589, 2.32, 'FR', 'Ile-de-France'),
+    'london': (51.5073, -0.1276, 'GB', 'England'),
+    'berlin': (52.5170, 13.3889, 'DE', ''),
+    'rome': (41.8933, 12.4829, 'IT', 'Lazio'),
+    'lisbon': (38.7077, -9.1365, 'PT', ''),
+    'new york': (40.7127, -74.0059, 'US', 'New York'),
+    'tokyo': (35.6828, 139.7594, 'JP', ''),
+    'sydney': (-33.8698, 151.2082, 'AU', 'New South Wales'),
+    'mexico city': (19.4326, -99.1332, 'MX', ''),
+    'cairo': (30.0443, 31.2357, 'EG', ''),
+}
+
+COUNTRIES = ('ES', 'FR', 'GB', 'DE', 'IT', 'PT', 'US', 'JP', 'AU', 'MX', 'EG', 'BR', 'IN')
+
+CONDITIONS = (
+    (800, 'Clear', 'clear sky', '01'),
+    (801, 'Clouds', 'few clouds', '02'),
+    (802, 'Clouds', 'scattered clouds', '03'),
+    (804, 'Clouds', 'overcast clouds', '04'),
+    (500, 'Rain', 'light rain', '10'),
+    (501, 'Rain', 'moderate rain', '10'),
+    (211, 'Thunderstorm', 'thunderstorm', '11'),
+    (600, 'Snow', 'light snow', '13'),
+    (741, 'Fog', 'fog', '50'),
+)
+
+# Weather ids handed out so far, so /data/2.5/group can resolve them
+city_ids = {}
+
+
+def geocode(query):
+    """Geocoding API answer (a list with zero or one match) for q=City,CC"""
+    parts = [part.strip() for part in query.split(',')]
+    name = parts[0]
+    country_code = parts[-1].upper() if len(parts) > 1 else ''
+
+    if not name or name.lower().startswith('invalid'):
+        return []
+
+    known = KNOWN_CITIES.get(name.lower())
+    if known and (not country_code or known[2] == country_code):
+        lat, lon, country, state = known
+    else:
+        rng = random.Random(f'{name.lower()},{country_code}')
+        lat = round(rng.uniform(-55, 70), 4)
+        lon = round(rng.uniform(-180, 180), 4)
+        country = country_code or rng.choice(COUNTRIES)
+        state = ''
+
+    match = {
+        'name': name.title(),
+        'local_names': {'en': name.title()},
+        'lat': lat,
+        'lon': lon,
+        'country': country,
+    }
+    if state:
+        match['state'] = state
+    return [match]
+
+
+def convert_temperature(celsius, units):
+    if units == 'metric':
+        return round(celsius, 2)
+    if units == 'imperial':
+        return round(celsius * 9 / 5 + 32, 2)
+    return round(celsius + 273.15, 2)  # standard: Kelvin
+
+
+def nearest_known_city(lat, lon):
+    """(name, country) of a known city within ~50 km, like a weather station name"""
+    for name, (city_lat, city_lon, country, _) in KNOWN_CITIES.items():
+        if abs(city_lat - lat) < 0.5 and abs(city_lon - lon) < 0.5:
+            return name.title(), country
+    return '', ''
+
+
+def current_weather(lat, lon, units):
+    """Current Weather API answer for a location, stable for 10 minutes"""
+    now = int(time.time())
+    rng = random.Random(f'{lat:.2f},{lon:.2f},{now // 600}')
+    city_id = random.Random(f'{lat:.4f},{lon:.4f}').randint(100000, 9999999)
+    city_ids[city_id] = (lat, lon)
+    name, country = nearest_known_city(lat, lon)
+
+    # Warmer near the equator, plus noise
+    celsius = 28 - abs(lat) * 0.45 + rng.gauss(0, 4)
+    code, main, description, icon = rng.choice(CONDITIONS)
+    wind_speed = round(rng.uniform(0, 12), 2)
+
+    return {
+        'coord': {'lon': lon, 'lat': lat},
+        'weather': [{'id': code, 'main': main, 'description': description, 'icon': icon + 'd'}],
+        'base': 'stations',
+        'main': {
+            'temp': convert_temperature(celsius, units),
+            'feels_like': convert_temperature(celsius - wind_speed * 0.3, units),
+            'temp_min': convert_temperature(celsius - 1.5, units),
+            'temp_max': convert_temperature(celsius + 1.5, units),
+            'pressure': rng.randint(990, 1030),
+            'humidity': rng.randint(20, 95),
+            'sea_level': rng.randint(1000, 1030),
+            'grnd_level': rng.randint(900, 1000),
+        },
+        'visibility': 10000,
+        'wind': {
+            'speed': wind_speed if units != 'imperial' else round(wind_speed * 2.237, 2),
+            'deg': rng.randint(0, 359),
+            'gust': round(wind_speed * 1.4, 2),
+        },
+        'clouds': {'all': rng.randint(0, 100)},
+        'dt': now - now % 600,
+        'sys': {'country': country, 'sunrise': now - now % 86400 + 21600, 'sunset': now - now % 86400 + 64800},
+        'timezone': int(lon / 15) * 3600,
+        'id': city_id,
+        'name': name,
+        'cod': 200,
+    }
+
+
+def forecast(lat, lon, units):
+    """5 day / 3 hour Forecast API answer (40 slots), stable for 10 minutes"""
+    now = int(time.time())
+    rng = random.Random(f'{lat:.2f},{lon:.2f},{now // 600},forecast')
+    city_id = random.Random(f'{lat:.4f},{lon:.4f}').randint(100000, 9999999)
+    name, country = nearest_known_city(lat, lon)
+    timezone = int(lon / 15) * 3600
+    base = 28 - abs(lat) * 0.45 + rng.gauss(0, 3)
+
+    slots = []
+    first = now - now % 10800 + 10800
+    for dt in range(first, first + 40 * 10800, 10800):
+        local_hour = (dt + timezone) % 86400 / 3600
+        # Coldest around 03:00 and warmest around 15:00 local time
+        celsius = base + 6 * math.sin((local_hour - 9) / 24 * 2 * math.pi) + rng.gauss(0, 1.5)
+        code, main, description, icon = rng.choice(CONDITIONS)
+        wind_speed = round(rng.uniform(0, 12), 2)
+        pop = round(rng.random() if main in ('Rain', 'Thunderstorm', 'Snow') else rng.random() * 0.3, 2)
+        slot = {
+            'dt': dt,
+            'main': {
+                'temp': convert_temperature(celsius, units),
+                'feels_like': convert_temperature(celsius - wind_speed * 0.3, units),
+                'temp_min': convert_temperature(celsius - 0.5, units),
+                'temp_max': convert_temperature(celsius + 0.5, units),
+                'pressure': rng.randint(990, 1030),
+                'sea_level': rng.randint(1000, 1030),
+                'grnd_level': rng.randint(900, 1000),
+                'humidity': rng.randint(20, 95),
+                'temp_kf': 0,
+            },
+            'weather': [{'id': code, 'main': main, 'description': description,
+                         'icon': icon + ('d' if 6 <= local_hour < 18 else 'n')}],
+            'clouds': {'all': rng.randint(0, 100)},
+            'wind': {
+                'speed': wind_speed if units != 'imperial' else round(wind_speed * 2.237, 2),
+                'deg': rng.randint(0, 359),
+                'gust': round(wind_speed * 1.4, 2),
+            },
+            'visibility': 10000,
+            'pop': pop,
+            'sys': {'pod': 'd' if 6 <= local_hour < 18 else 'n'},
+            'dt_txt': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(dt)),
+        }
+        if main in ('Rain', 'Thunderstorm'):
+            slot['rain'] = {'3h': round(rng.uniform(0.1, 6), 2)}
+        slots.append(slot)
+
+    return {
+        'cod': '200',
+        'message': 0,
+        'cnt': len(slots),
+        'list': slots,
+        'city': {
+            'id': city_id,
+            'name': name,
+            'coord': {'lat': lat, 'lon': lon},
+            'country': country,
+            'population': 0,
+            'timezone': timezone,
+            'sunrise': now - now % 86400 + 21600,
+            'sunset': now - now % 86400 + 64800,
+        },
+    }
+
+
+# ============================================================================
+# FAULT INJECTION
+# ============================================================================
+
+def parse_latency(spec):
+    """
+    Turn a latency spec into a function returning seconds:
+    '0.2' or 'fixed:0.2', 'uniform:MIN,MAX', 'normal:MEAN,STDDEV' or
+    'lognormal:MEDIAN,SIGMA' (long-tailed, the closest to real APIs).
+    """
+    kind, _, args = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+    values = [float(value) for value in args.split(',')]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == 'normal' and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(*values))
+    if kind == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0]) if values[0] > 0 else float('-inf')
+        return lambda rng: rng.lognormvariate(mu, values[1]) if values[0] > 0 else 0.0
+    raise argparse.ArgumentTypeError(f'Invalid latency spec: {spec!r}')
+
+
+class Faults:
+    """Decides, per call, whether to answer with 429, a 5xx or the real payload"""
+
+    def __init__(self, error_rate, throttle_rate, calls_per_minute, rng):
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.calls_per_minute = calls_per_minute
+        self.rng = rng
+        self.window = None
+        self.window_calls = 0
+
+    def pick(self):
+        """Return (status, body, headers) for an injected failure, or None"""
+        # Fixed one-minute quota windows, like OpenWeatherMap's plans
+        if self.calls_per_minute:
+            window = int(time.time() // 60)
+            if window != self.window:
+                self.window, self.window_calls = window, 0
+            self.window_calls += 1
+            if self.window_calls > self.calls_per_minute:
+                return too_many_requests(60 - int(time.time() % 60))
+
+        if self.rng.random() < self.throttle_rate:
+            return too_many_requests(1)
+        if self.rng.random() < self.error_rate:
+            status = self.rng.choice((500, 502, 503))
+            return status, {'cod': status, 'message': 'Internal error'}, {}
+        return None
+
+
+def too_many_requests(retry_after):
+    return 429, {
+        'cod': 429,
+        'message': 'Your account is temporarily blocked due to exceeding of requests limitation '
+                   'of your subscription type. Please choose the proper subscription '
+                   'https://openweathermap.org/price'
+    }, {'Retry-After': str(retry_after)}
+
+
+# ============================================================================
+# HTTP SERVER
+# ============================================================================
+
+UNAUTHORIZED = {
+    'cod': 401,
+    'message': 'Invalid API key. Please see https://openweathermap.org/faq#error401 for more info.'
+}
+
+
+class Stub:
+    def __init__(self, latency, faults, rng):
+        self.latency = latency
+        self.faults = faults
+        self.rng = rng
+        self.stats = Counter()
+        self.key_calls = defaultdict(Counter)  # endpoint -> query key -> calls
+
+    def route(self, path, args):
+        """Return (status, body, headers) for one API call"""
+        if path == '/stats':
+            return 200, dict(self.stats), {}
+        if path == '/stats/keys':
+            return 200, {endpoint: dict(calls) for endpoint, calls in self.key_calls.items()}, {}
+
+        endpoint = {
+            '/geo/1.0/direct': 'geocoding',
+            '/data/2.5/weather': 'weather',
+            '/data/2.5/group': 'group',
+            '/data/2.5/forecast': 'forecast',
+        }.get(path)
+        if endpoint is None:
+            return 404, {'cod': '404', 'message': 'Internal error'}, {}
+        self.stats[f'{endpoint}_calls'] += 1
+        if endpoint == 'geocoding':
+            key = args.get('q')
+        elif endpoint == 'group':
+            key = args.get('id')
+        else:
+            key = f'{args.get("lat")},{args.get("lon")}'
+        self.key_calls[endpoint][key] += 1
+
+        if not args.get('appid'):
+            return 401, UNAUTHORIZED, {}
+
+        failure = self.faults.pick()
+        if failure is not None:
+            self.stats[f'status_{failure[0]}'] += 1
+            return failure
+
+        units = args.get('units', 'standard')
+        try:
+            if endpoint == 'geocoding':
+                limit = int(args.get('limit', 5))
+                return 200, geocode(args['q'])[:limit], {}
+            if endpoint == 'weather':
+                return 200, current_weather(float(args['lat']), float(args['lon']), units), {}
+            if endpoint == 'forecast':
+                return 200, forecast(float(args['lat']), float(args['lon']), units), {}
+            ids = [int(city_id) for city_id in args['id'].split(',')]
+            found = [
+                current_weather(*city_ids[city_id], units) for city_id in ids if city_id in city_ids
+            ]
+            return 200, {'cnt': len(found), 'list': found}, {}
+        except (KeyError, ValueError):
+            return 400, {'cod': '400', 'message': 'Nothing to geocode' if endpoint == 'geocoding'
+                         else 'wrong latitude or longitude'}, {}
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 keep-alive requests on one connection"""
+        self.stats['connections'] += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0) or 0):
+                    await reader.readexactly(int(headers['content-length']))
+
+                method, target = request_line.decode('latin-1').split()[:2]
+                url = urlsplit(target)
+                args = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+                if method != 'GET':
+                    status, body, extra = 405, {'cod': '405', 'message': 'Method not allowed'}, {}
+                else:
+                    status, body, extra = self.route(url.path, args)
+                    if not url.path.startswith('/stats'):
+                        await asyncio.sleep(self.latency(self.rng))
+
+                payload = json.dumps(body).encode()
+                head = [f'HTTP/1.1 {status} {STATUS_TEXT.get(status, "")}',
+                        'Content-Type: application/json; charset=utf-8',
+                        f'Content-Length: {len(payload)}']
+                head += [f'{name}: {value}' for name, value in extra.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + payload)
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 429: 'Too Many Requests', 500: 'Internal Server Error',
+    502: 'Bad Gateway', 503: 'Service Unavailable',
+}
+
+
+async def serve(host, port, stub):
+    server = await asyncio.start_server(stub.handle, host, port, backlog=2048)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='OpenWeatherMap stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency('lognormal:0.1,0.4'),
+                        help="per-call latency: 'fixed:S', 'uniform:MIN,MAX', 'normal:MEAN,SD' "
+                             "or 'lognormal:MEDIAN,SIGMA' (default: lognormal:0.1,0.4)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of calls answered with 500/502/503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of calls answered with 429')
+    parser.add_argument('--calls-per-minute', type=int, default=0,
+                        help='answer 429 once this many calls were made in the current minute')
+    parser.add_argument('--seed', type=int, default=None, help='seed for latency and fault draws')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    stub = Stub(args.latency, Faults(args.error_rate, args.throttle_rate, args.calls_per_minute, rng), rng)
+    print(f'OpenWeatherMap stub listening on http://{args.host}:{args.port}', flush=True)
+    try:
+        asyncio.run(serve(args.host, args.port, stub))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
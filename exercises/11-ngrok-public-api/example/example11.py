@@ -1,10 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from collections import Counter, deque
+from datetime import datetime, timezone
+import atexit
+import bisect
+import hashlib
+import hmac
+import itertools
+import json
+import mmap
+import os
+import queue
+import re
+import socket
+import struct
+import threading
+import time
 
 app = Flask(__name__)
 
-# In-memory storage for demonstration
+# In-memory storage for demonstration (webhook events: see WEBHOOK EVENT LOG)
 users = {}
-webhook_events = []
 
 
 @app.route('/health', methods=['GET'])
@@ -73,35 +88,828 @@ def users_endpoint():
 
 
 # ============================================================================
-# GITHUB WEBHOOK ENDPOINT - COMPLETE SOLUTION
+# WEBHOOK EVENT STORE (bounded ring buffer)
 # ============================================================================
 
-@app.route('/webhooks/github', methods=['POST'])
-def github_webhook():
+# Received events are kept in a fixed number of slots and also within a byte
+# budget; once either is reached the oldest events are dropped. Every event
+# gets a sequence number, so clients page through them with ?since= instead
+# of downloading everything each time.
+WEBHOOK_EVENTS_MAX = int(os.environ.get('WEBHOOK_EVENTS_MAX', 10000))
+WEBHOOK_EVENTS_MAX_BYTES = int(os.environ.get('WEBHOOK_EVENTS_MAX_BYTES', 16 * 1024 * 1024))
+WEBHOOK_EVENTS_PAGE_SIZE = 100
+WEBHOOK_EVENTS_MAX_PAGE_SIZE = 1000
+
+
+class WebhookEventRing:
     """
-    Receives REAL push events from GitHub.
+    Fixed-capacity ring buffer of events, stored JSON-encoded.
 
-    When you configure a webhook in GitHub repository settings, it sends POST
-    requests to this endpoint with information about repository events.
+    Sequence numbers are consecutive, so the event with sequence `seq` lives
+    in slot `seq % capacity` and any page is found without a search.
+    Encoded events take a fraction of the memory of the dicts and go into
+    responses as they are.
+    """
 
-    Official documentation: https://docs.github.com/en/webhooks/webhook-events-and-payloads
+    def __init__(self, capacity, max_bytes):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.slots = [None] * capacity
+        self.first_seq = 1   # oldest retained event
+        self.next_seq = 1    # sequence number of the next event
+        self.bytes = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        # Called with (seq, encoded event) in sequence order, under the lock
+        self.listeners = []
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def drop_oldest(self):
+        slot = self.first_seq % self.capacity
+        self.bytes -= len(self.slots[slot])
+        self.slots[slot] = None
+        self.first_seq += 1
+        self.dropped += 1
+
+    def append(self, event):
+        """Store an event and return its sequence number"""
+        with self.lock:
+            seq = self.next_seq
+            encoded = json.dumps(dict(event, seq=seq), separators=(',', ':')).encode()
+            while len(self) and (len(self) >= self.capacity or self.bytes + len(encoded) > self.max_bytes):
+                self.drop_oldest()
+            self.slots[seq % self.capacity] = encoded
+            self.bytes += len(encoded)
+            self.next_seq += 1
+            for listener in self.listeners:
+                listener(seq, encoded)
+            return seq
+
+    def page(self, since, limit):
+        """Encoded events with a sequence number above `since`, oldest first"""
+        with self.lock:
+            start = max(since + 1, self.first_seq)
+            end = min(start + limit, self.next_seq)
+            return [self.slots[seq % self.capacity] for seq in range(start, end)], start, end - 1
+
+    def clear(self):
+        """Drop every event; sequence numbers keep counting so pollers see no reuse"""
+        with self.lock:
+            count = len(self)
+            self.slots = [None] * self.capacity
+            self.first_seq = self.next_seq
+            self.bytes = 0
+            return count
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'stored_events': len(self),
+                'stored_bytes': self.bytes,
+                'max_events': self.capacity,
+                'max_bytes': self.max_bytes,
+                'first_seq': self.first_seq if len(self) else None,
+                'last_seq': self.next_seq - 1,
+                'dropped': self.dropped
+            }
+
+
+# ============================================================================
+# WEBHOOK EVENT LOG (durable, segmented)
+# ============================================================================
+
+# With WEBHOOK_LOG_DIR set (by default a private directory in the app's
+# instance folder), events are appended to files on disk and survive
+# restarts; set it to an empty string to keep them only in the ring buffer
+# above. Records go into responses as they are, so the directory must not
+# be writable by anyone else. The log is split into segments: a file of
+# newline-terminated JSON records plus an index of 8-byte record offsets.
+# Pages are read through mmap, so a request touches only the records it
+# returns however much history is kept.
+WEBHOOK_LOG_DIR = os.environ.get('WEBHOOK_LOG_DIR', os.path.join(app.instance_path, 'webhook_log'))
+# A new segment is started when the current one reaches either limit
+WEBHOOK_LOG_SEGMENT_BYTES = int(os.environ.get('WEBHOOK_LOG_SEGMENT_BYTES', 8 * 1024 * 1024))
+WEBHOOK_LOG_SEGMENT_SECONDS = int(os.environ.get('WEBHOOK_LOG_SEGMENT_SECONDS', 3600))
+# Oldest segments are deleted once the log is over this size or they are this old
+WEBHOOK_LOG_RETENTION_BYTES = int(os.environ.get('WEBHOOK_LOG_RETENTION_BYTES', 256 * 1024 * 1024))
+WEBHOOK_LOG_RETENTION_SECONDS = int(os.environ.get('WEBHOOK_LOG_RETENTION_SECONDS', 7 * 24 * 3600))
+# How often both limits are applied while no events arrive
+WEBHOOK_LOG_EXPIRE_INTERVAL = float(os.environ.get('WEBHOOK_LOG_EXPIRE_INTERVAL', 60))
+# Events are written in batches: once this many are pending, or this many
+# seconds after the first one arrived
+WEBHOOK_LOG_BATCH = 256
+WEBHOOK_LOG_FLUSH_INTERVAL = float(os.environ.get('WEBHOOK_LOG_FLUSH_INTERVAL', 0.2))
+# Most events waiting for a write before append() blocks
+WEBHOOK_LOG_MAX_UNFLUSHED = 16 * WEBHOOK_LOG_BATCH
+# When written batches reach the disk: 'batch' (fsync after every write),
+# 'interval' (at most once per WEBHOOK_LOG_FSYNC_INTERVAL) or 'never' (left to the OS)
+WEBHOOK_LOG_FSYNC = os.environ.get('WEBHOOK_LOG_FSYNC', 'batch')
+WEBHOOK_LOG_FSYNC_INTERVAL = 1.0
+
+INDEX_ENTRY = struct.Struct('<Q')
+
+
+class LogSegment:
+    """
+    Records first_seq, first_seq + 1, ... in <first_seq>.log, with the
+    offset of each record in <first_seq>.idx.
     """
-    data = request.get_json()
 
-    if not data:
-        return jsonify({'error': 'Invalid payload'}), 400
+    def __init__(self, directory, first_seq):
+        self.first_seq = first_seq
+        name = os.path.join(directory, f'{first_seq:020d}')
+        self.log_path, self.index_path = name + '.log', name + '.idx'
+        self.log_file = self.index_file = None
+        # (records, bytes), replaced in one assignment so readers never
+        # see one updated without the other
+        self.extent = (0, 0)
+        self.created = time.time()
+        self.views = None
 
-    # Handle GitHub "ping" event (sent when webhook is first created)
-    # This confirms your webhook endpoint is reachable
-    if 'zen' in data and 'hook_id' in data:
-        print(f"\n{'='*60}")
-        print(f"📥 GitHub Webhook Ping Received!")
-        print(f"   Hook ID: {data.get('hook_id')}")
-        print(f"   Zen: {data.get('zen')}")
-        print(f"   ✅ Webhook is configured correctly!")
-        print(f"{'='*60}\n")
-        return jsonify({'status': 'pong'}), 200
+    @classmethod
+    def create(cls, directory, first_seq):
+        segment = cls(directory, first_seq)
+        segment.open_for_append()
+        return segment
+
+    @classmethod
+    def load(cls, directory, first_seq):
+        segment = cls(directory, first_seq)
+        segment.extent = (os.path.getsize(segment.index_path) // INDEX_ENTRY.size,
+                          os.path.getsize(segment.log_path))
+        segment.created = os.path.getmtime(segment.log_path)
+        return segment
+
+    def recover(self):
+        """Repair the tail a crash may have left: offsets past the data, records missing from the index, half a record"""
+        log_size = os.path.getsize(self.log_path)
+        with open(self.index_path, 'rb') as index_file:
+            offsets = [entry for (entry,) in INDEX_ENTRY.iter_unpack(
+                index_file.read()[:os.path.getsize(self.index_path) // INDEX_ENTRY.size * INDEX_ENTRY.size])]
+        while offsets and offsets[-1] >= log_size:
+            offsets.pop()
+
+        # Everything after the last indexed record (at most one batch) is re-indexed
+        # up to the last complete line
+        start = offsets.pop() if offsets else 0
+        with open(self.log_path, 'rb') as log_file:
+            log_file.seek(start)
+            tail = log_file.read()
+        end = start
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            offsets.append(end)
+            end += len(line)
+
+        with open(self.log_path, 'r+b') as log_file:
+            log_file.truncate(end)
+        with open(self.index_path, 'wb') as index_file:
+            index_file.write(b''.join(INDEX_ENTRY.pack(offset) for offset in offsets))
+        self.extent = (len(offsets), end)
+
+    def open_for_append(self):
+        self.log_file = open(self.log_path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+
+    def write(self, records):
+        """Append encoded records (each ending in a newline) and their offsets"""
+        count, size = self.extent
+        offsets = []
+        for record in records:
+            offsets.append(size)
+            size += len(record)
+        # Data first: after a crash an index entry never points past the data
+        self.log_file.write(b''.join(records))
+        self.log_file.flush()
+        self.index_file.write(b''.join(INDEX_ENTRY.pack(offset) for offset in offsets))
+        self.index_file.flush()
+        self.extent = (count + len(records), size)
+
+    def sync(self):
+        os.fsync(self.log_file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def seal(self):
+        """Stop writing to this segment"""
+        if self.log_file is not None:
+            self.log_file.close()
+            self.index_file.close()
+            self.log_file = self.index_file = None
+
+    def mapped(self, extent):
+        """mmap views of the log and the index covering at least `extent`"""
+        views = self.views
+        if views is None or views[0] != extent:
+            count, size = extent
+            with open(self.log_path, 'rb') as log_file, open(self.index_path, 'rb') as index_file:
+                views = (extent,
+                         mmap.mmap(log_file.fileno(), size, access=mmap.ACCESS_READ),
+                         mmap.mmap(index_file.fileno(), count * INDEX_ENTRY.size, access=mmap.ACCESS_READ))
+            self.views = views
+        return views[1], views[2]
+
+    def read(self, start, stop):
+        """Records start..stop-1 (sequence numbers, all in this segment) without their newlines"""
+        extent = self.extent
+        count, size = extent
+        log, index = self.mapped(extent)
+        first, last = start - self.first_seq, stop - self.first_seq
+        offsets = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size)[0] for i in range(first, min(last + 1, count))]
+        if len(offsets) == last - first:
+            offsets.append(size)
+        return [log[begin:end - 1] for begin, end in zip(offsets, offsets[1:])]
+
+    def delete(self):
+        self.seal()
+        self.views = None
+        for path in (self.log_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class WebhookEventLog:
+    """
+    Durable event store with the same interface as WebhookEventRing.
+
+    append() only queues the encoded event; a flusher thread writes queued
+    events in batches. Queued events are served from memory until written.
+    The flusher also ages out segments every WEBHOOK_LOG_EXPIRE_INTERVAL,
+    so retention holds when no events arrive.
+
+    Nothing is read from disk until open().
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.has_pending = threading.Condition(self.lock)
+        self.flushed = threading.Condition(self.lock)
+        self.write_lock = threading.Lock()   # one batch write, rotation or clear at a time
+        self.unflushed = []                  # encoded events after flushed_seq
+        self.dropped = 0
+        self.listeners = []   # as in WebhookEventRing
+        self.last_sync = time.monotonic()
+        self.flusher = None
+        self.segments = []
+        self.flushed_seq = self.next_seq = 0
+
+    def open(self):
+        """
+        Load the segments, repair the active one and start the flusher.
+        Returns True only for the call that opened the log.
+        """
+        if self.flusher is not None:
+            return False
+        with self.write_lock:
+            if self.flusher is not None:
+                return False
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            first_seqs = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                                if name.endswith('.log') and name[:-4].isdigit())
+            segments = [LogSegment.load(self.directory, first_seq) for first_seq in first_seqs]
+            # A sealed segment without records claims sequence numbers that
+            # belong to the one before it; nothing is lost by deleting it
+            for segment in [segment for segment in segments[:-1] if not segment.extent[0]]:
+                segments.remove(segment)
+                segment.delete()
+            if segments:
+                segments[-1].recover()
+                segments[-1].open_for_append()
+            else:
+                segments.append(LogSegment.create(self.directory, 1))
+            active = segments[-1]
+            with self.lock:
+                self.segments = segments
+                self.flushed_seq = active.first_seq + active.extent[0] - 1
+                self.next_seq = self.flushed_seq + 1
+            self.expire()
+            atexit.register(self.flush)
+            self.start_flusher()
+            return True
+
+    @property
+    def first_seq(self):
+        return self.segments[0].first_seq
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def append(self, event):
+        """Queue an event for the next batch write and return its sequence number"""
+        with self.lock:
+            # When the disk falls behind, the webhook workers wait here and the
+            # webhook queue fills up (503s) rather than this list growing
+            while len(self.unflushed) >= WEBHOOK_LOG_MAX_UNFLUSHED:
+                self.flushed.wait()
+            seq = self.next_seq
+            encoded = json.dumps(dict(event, seq=seq), separators=(',', ':')).encode()
+            self.unflushed.append(encoded + b'\n')
+            self.next_seq += 1
+            if len(self.unflushed) in (1, WEBHOOK_LOG_BATCH):
+                self.has_pending.notify()
+            for listener in self.listeners:
+                listener(seq, encoded)
+            return seq
+
+    def start_flusher(self):
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run_flusher, name='webhook-log-flusher', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        next_age_out = time.monotonic() + WEBHOOK_LOG_EXPIRE_INTERVAL
+        while True:
+            with self.has_pending:
+                while not self.unflushed and time.monotonic() < next_age_out:
+                    self.has_pending.wait(next_age_out - time.monotonic())
+                if self.unflushed and len(self.unflushed) < WEBHOOK_LOG_BATCH:
+                    # Give the batch time to fill; append() wakes us when it is full
+                    self.has_pending.wait(WEBHOOK_LOG_FLUSH_INTERVAL)
+            try:
+                self.flush()
+                if time.monotonic() >= next_age_out:
+                    self.age_out()
+                    next_age_out = time.monotonic() + WEBHOOK_LOG_EXPIRE_INTERVAL
+            except OSError as e:
+                app.logger.error(f'Failed to write webhook log: {e}')
+                time.sleep(WEBHOOK_LOG_FLUSH_INTERVAL)
+
+    def flush(self):
+        """Write every queued event, a batch at a time, rotating and expiring segments as needed"""
+        with self.write_lock:
+            while True:
+                with self.lock:
+                    batch = self.unflushed[:WEBHOOK_LOG_BATCH]
+                if not batch:
+                    return
+                active = self.segments[-1]
+                count, size = active.extent
+                if count and (size >= WEBHOOK_LOG_SEGMENT_BYTES
+                              or time.time() - active.created >= WEBHOOK_LOG_SEGMENT_SECONDS):
+                    active = self.rotate()
+                active.write(batch)
+                now = time.monotonic()
+                if WEBHOOK_LOG_FSYNC == 'batch' or (
+                        WEBHOOK_LOG_FSYNC == 'interval' and now - self.last_sync >= WEBHOOK_LOG_FSYNC_INTERVAL):
+                    active.sync()
+                    self.last_sync = now
+                with self.lock:
+                    del self.unflushed[:len(batch)]
+                    self.flushed_seq += len(batch)
+                    self.flushed.notify_all()
+
+    def rotate(self):
+        """Seal the active segment and start the next one (caller holds write_lock)"""
+        sealed = self.segments[-1]
+        if WEBHOOK_LOG_FSYNC != 'never':
+            sealed.sync()
+        sealed.seal()
+        active = LogSegment.create(self.directory, self.flushed_seq + 1)
+        with self.lock:
+            self.segments.append(active)
+        self.expire()
+        return active
+
+    def age_out(self):
+        """Seal the active segment once it is too old, even without new writes, then expire"""
+        with self.write_lock:
+            active = self.segments[-1]
+            if active.extent[0] and time.time() - active.created >= WEBHOOK_LOG_SEGMENT_SECONDS:
+                self.rotate()
+            else:
+                self.expire()
+
+    def expire(self):
+        """Delete the oldest sealed segments beyond the size or age limit"""
+        cutoff = time.time() - WEBHOOK_LOG_RETENTION_SECONDS
+        expired = []
+        with self.lock:
+            total = sum(segment.extent[1] for segment in self.segments)
+            while len(self.segments) > 1:
+                oldest = self.segments[0]
+                if total <= WEBHOOK_LOG_RETENTION_BYTES and os.path.getmtime(oldest.log_path) >= cutoff:
+                    break
+                expired.append(self.segments.pop(0))
+                total -= oldest.extent[1]
+                self.dropped += oldest.extent[0]
+        for segment in expired:
+            segment.delete()
+
+    def page(self, since, limit):
+        """Encoded events with a sequence number above `since`, oldest first"""
+        with self.lock:
+            # Empty segments other than the active one hold no events to page through
+            segments = [segment for segment in self.segments[:-1] if segment.extent[0]] + self.segments[-1:]
+            flushed_seq = self.flushed_seq
+            start = max(since + 1, segments[0].first_seq)
+            end = min(start + limit, self.next_seq)   # exclusive
+            # self.unflushed[i] holds event flushed_seq + 1 + i
+            unflushed = self.unflushed[max(start - flushed_seq - 1, 0):max(end - flushed_seq - 1, 0)]
+
+        events = []
+        seq = start
+        disk_end = min(end, flushed_seq + 1)
+        first_seqs = [segment.first_seq for segment in segments]
+        while seq < disk_end:
+            position = bisect.bisect_right(first_seqs, seq) - 1
+            stop = disk_end if position + 1 == len(segments) else min(disk_end, first_seqs[position + 1])
+            try:
+                events += segments[position].read(seq, stop)
+            except (OSError, ValueError):
+                # Expired while we read: return what we have, so the events
+                # still line up with their sequence numbers
+                return events, start, start + len(events) - 1
+            seq = stop
+        events += [event[:-1] for event in unflushed]
+        return events, start, start + len(events) - 1
+
+    def clear(self):
+        """Delete every segment; sequence numbers keep counting so pollers see no reuse"""
+        with self.write_lock:
+            with self.lock:
+                count = len(self)
+                self.unflushed = []
+                self.flushed.notify_all()
+                first_seq = self.next_seq
+                self.flushed_seq = first_seq - 1
+                removed = self.segments
+            # Deleted before the new segment is created, which may reuse the name
+            for segment in removed:
+                segment.delete()
+            active = LogSegment.create(self.directory, first_seq)
+            with self.lock:
+                self.segments = [active]
+            return count
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'stored_events': len(self),
+                'stored_bytes': sum(segment.extent[1] for segment in self.segments),
+                'max_bytes': WEBHOOK_LOG_RETENTION_BYTES,
+                'first_seq': self.first_seq if len(self) else None,
+                'last_seq': self.next_seq - 1,
+                'dropped': self.dropped,
+                'segments': len(self.segments),
+                'unflushed': len(self.unflushed),
+                'directory': self.directory,
+                'fsync': WEBHOOK_LOG_FSYNC
+            }
+
+
+if WEBHOOK_LOG_DIR:
+    webhook_events = WebhookEventLog(WEBHOOK_LOG_DIR)
+else:
+    webhook_events = WebhookEventRing(WEBHOOK_EVENTS_MAX, WEBHOOK_EVENTS_MAX_BYTES)
+
+
+
+# ============================================================================
+# WEBHOOK LIVE STREAM (Server-Sent Events)
+# ============================================================================
+
+# GET /webhooks/stream pushes every stored event to connected browsers.
+# Each event is turned into an SSE frame once and kept in one shared buffer
+# of the latest WEBHOOK_STREAM_BUFFER frames; a subscriber is only a
+# position in that buffer. A subscriber that falls out of the buffer is
+# disconnected rather than buffered for: EventSource reconnects with
+# Last-Event-ID and catches up from the event store.
+WEBHOOK_STREAM_BUFFER = int(os.environ.get('WEBHOOK_STREAM_BUFFER', 1024))
+WEBHOOK_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('WEBHOOK_STREAM_MAX_SUBSCRIBERS', 100))
+# Seconds between keep-alive comments, so ngrok and proxies keep idle streams open
+WEBHOOK_STREAM_HEARTBEAT = 15
+# Events per frame batch when catching up from the store
+WEBHOOK_STREAM_CATCH_UP = 200
+# Milliseconds EventSource waits before reconnecting
+WEBHOOK_STREAM_RETRY_MS = 2000
+# Kernel send buffer per subscriber. Left alone, the OS grows it to megabytes
+# and a slow reader looks up to date while its backlog sits in the kernel.
+WEBHOOK_STREAM_SOCKET_BUFFER = 64 * 1024
+
+
+def sse_frame(seq, encoded):
+    return b'id: %d\nevent: push\ndata: %s\n\n' % (seq, encoded)
+
+
+class WebhookStream:
+    """Fans stored events out to SSE subscribers through one bounded shared buffer"""
+
+    def __init__(self, store, size):
+        self.store = store
+        self.frames = deque(maxlen=size)   # (seq, frame), consecutive sequence numbers
+        self.changed = threading.Condition()
+        self.subscribers = 0
+        self.dropped = 0
+        store.listeners.append(self.publish)
+
+    def publish(self, seq, encoded):
+        """Store listener: buffer the event's frame and wake the subscribers"""
+        if not self.subscribers:
+            return  # nobody listening; a new subscriber catches up from the store
+        with self.changed:
+            self.frames.append((seq, sse_frame(seq, encoded)))
+            self.changed.notify_all()
+
+    def subscribe(self):
+        with self.changed:
+            if self.subscribers >= WEBHOOK_STREAM_MAX_SUBSCRIBERS:
+                return False
+            if not self.subscribers:
+                # Frames were not kept while nobody listened; start without a gap
+                self.frames.clear()
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self.changed:
+            self.subscribers -= 1
+
+    def buffered_after(self, cursor):
+        """Frames after `cursor` from the shared buffer, or None when the next one has been evicted"""
+        with self.changed:
+            if not self.frames:
+                return []
+            skip = cursor + 1 - self.frames[0][0]
+            if skip < 0:
+                return None
+            return [frame for _, frame in itertools.islice(self.frames, skip, None)]
+
+    def follow(self, cursor):
+        """
+        Generate the SSE response for a subscriber that has seen events up to
+        `cursor` (subscribed by the caller, who unsubscribes when it closes).
+        """
+        yield b'retry: %d\n\n' % WEBHOOK_STREAM_RETRY_MS
+
+        # Catch up from the store: the events after Last-Event-ID, and any
+        # stored just before we subscribed. Newer ones are all published.
+        while True:
+            events, start, last = self.store.page(cursor, WEBHOOK_STREAM_CATCH_UP)
+            if not events:
+                cursor = max(cursor, start - 1)
+                break
+            yield b''.join(sse_frame(start + i, encoded) for i, encoded in enumerate(events))
+            cursor = last
+
+        while True:
+            frames = self.buffered_after(cursor)
+            if frames is None:
+                # Fell a whole buffer behind: let it reconnect and catch
+                # up from the store instead of holding events for it
+                with self.changed:
+                    self.dropped += 1
+                yield b'event: dropped\ndata: {"reason": "too slow", "last_event_id": %d}\n\n' % cursor
+                return
+            if frames:
+                cursor += len(frames)
+                yield b''.join(frames)
+                continue
+            with self.changed:
+                if self.frames and self.frames[-1][0] > cursor:
+                    continue
+                woken = self.changed.wait(WEBHOOK_STREAM_HEARTBEAT)
+            if not woken:
+                yield b': keep-alive\n\n'
+
+    def snapshot(self):
+        with self.changed:
+            return {
+                'subscribers': self.subscribers,
+                'max_subscribers': WEBHOOK_STREAM_MAX_SUBSCRIBERS,
+                'buffered': len(self.frames),
+                'buffer_size': self.frames.maxlen,
+                'dropped_subscribers': self.dropped
+            }
+
+
+webhook_stream = WebhookStream(webhook_events, WEBHOOK_STREAM_BUFFER)
+
+
+# ============================================================================
+# WEBHOOK STATISTICS (incremental aggregates)
+# ============================================================================
+
+# Push and commit counts are added up as events are stored, per repository,
+# pusher and branch, in all-time totals and in time buckets at two
+# resolutions. /webhooks/stats then adds up counters instead of scanning
+# events: its cost depends on the number of groups and buckets in the
+# window, not on how many events arrived.
+WEBHOOK_STATS_DIMENSIONS = ('repository', 'pusher', 'branch')
+# (bucket seconds, buckets kept): per minute for two days, per hour for 90
+# days. Minutes are kept an hour longer than two days, so windows up to 2d
+# start at a minute; longer ones start at a whole hour and can count up to
+# an hour of events from before the window.
+WEBHOOK_STATS_RESOLUTIONS = ((60, 2 * 24 * 60 + 60), (3600, 90 * 24))
+WEBHOOK_STATS_TIME_GROUPS = {'minute': 60, 'hour': 3600, 'day': 86400}
+WEBHOOK_STATS_DEFAULT_LIMIT = 50
+WINDOW_PATTERN = re.compile(r'^(\d+)([smhd])$')
+WINDOW_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def branch_name(ref):
+    return ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else ref
+
+
+class WebhookAggregates:
+    """Counters of [pushes, commits] per dimension value, in total and per time bucket"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {dimension: {} for dimension in WEBHOOK_STATS_DIMENSIONS}
+        # One {bucket start: {dimension: {value: [pushes, commits]}}} per resolution
+        self.buckets = [{} for _ in WEBHOOK_STATS_RESOLUTIONS]
+        self.events = 0
+        self.replaying = False
+
+    def add(self, event):
+        """Count one stored event (without received_at it only reaches the totals)"""
+        values = {
+            'repository': event.get('repository', 'unknown'),
+            'pusher': event.get('pusher', 'unknown'),
+            'branch': branch_name(event.get('ref', 'unknown')),
+        }
+        commits = event.get('commits_count', 0)
+        received_at = event.get('received_at')
+        with self.lock:
+            self.events += 1
+            targets = [self.totals]
+            if received_at is not None:
+                for (seconds, kept), buckets in zip(WEBHOOK_STATS_RESOLUTIONS, self.buckets):
+                    start = int(received_at // seconds) * seconds
+                    bucket = buckets.get(start)
+                    if bucket is None:
+                        cutoff = (int(time.time() // seconds) - kept + 1) * seconds
+                        if start < cutoff:
+                            continue  # older than this resolution keeps (replayed history)
+                        for old in [old for old in buckets if old < cutoff]:
+                            del buckets[old]
+                        bucket = buckets[start] = {dimension: {} for dimension in WEBHOOK_STATS_DIMENSIONS}
+                    targets.append(bucket)
+            for counters in targets:
+                for dimension, value in values.items():
+                    counts = counters[dimension].setdefault(value, [0, 0])
+                    counts[0] += 1
+                    counts[1] += commits
+
+    def query(self, group_by, window=None, dimension=None, value=None, now=None):
+        """
+        {key: [pushes, commits]} grouped by a dimension or a time group,
+        over the last `window` seconds (None for all time, to the bucket),
+        optionally only for events where `dimension` equals `value`.
+        """
+        now = time.time() if now is None else now
+        by_time = group_by in WEBHOOK_STATS_TIME_GROUPS
+        if dimension is not None and dimension != group_by and not by_time:
+            raise ValueError('a filter must be on the group_by dimension when grouping by dimension')
+
+        with self.lock:
+            if window is None and not by_time:
+                counters = self.totals[group_by]
+                if value is not None:
+                    counters = {value: counters[value]} if value in counters else {}
+                return {key: list(counts) for key, counts in counters.items()}
 
+            usable = [(seconds, kept, buckets)
+                      for (seconds, kept), buckets in zip(WEBHOOK_STATS_RESOLUTIONS, self.buckets)
+                      if not by_time or seconds <= WEBHOOK_STATS_TIME_GROUPS[group_by]]
+            if window is not None and all(seconds * kept < window for seconds, kept, _ in usable):
+                raise ValueError('window is longer than the statistics are kept for that grouping')
+
+            result = {}
+            for start, bucket in self.window_buckets(usable, 0 if window is None else now - window, now):
+                if by_time:
+                    size = WEBHOOK_STATS_TIME_GROUPS[group_by]
+                    key = int(start // size) * size
+                    if dimension is None:
+                        # Every event has exactly one repository, so this is the bucket total
+                        groups = bucket['repository'].values()
+                    else:
+                        groups = [bucket[dimension][value]] if value in bucket[dimension] else []
+                    for pushes, commits in groups:
+                        counts = result.setdefault(key, [0, 0])
+                        counts[0] += pushes
+                        counts[1] += commits
+                else:
+                    for key, (pushes, commits) in bucket[group_by].items():
+                        if value is None or key == value:
+                            counts = result.setdefault(key, [0, 0])
+                            counts[0] += pushes
+                            counts[1] += commits
+            return result
+
+    @staticmethod
+    def window_buckets(usable, since, now):
+        """
+        (start, bucket) pairs covering `since`..`now`: whole coarse buckets
+        for most of the window and fine ones for the edge, so a 24h window
+        sums 24 hourly buckets and at most 60 per-minute ones. Where the
+        fine buckets no longer reach `since`, the edge is a whole coarse one.
+        """
+        pairs = []
+        end = int(now) + 1
+        for position in range(len(usable) - 1, -1, -1):
+            seconds, kept, buckets = usable[position]
+            oldest = (int(now // seconds) - kept + 1) * seconds
+            finer = usable[position - 1] if position else None
+            # Leave the partial bucket at the edge to the next finer
+            # resolution, if that still keeps it
+            if finer is not None and (int(now // finer[0]) - finer[1] + 1) * finer[0] <= since:
+                first = -(-int(since) // seconds) * seconds
+            else:
+                first = int(since // seconds) * seconds
+            for start in range(max(first, oldest), end, seconds):
+                bucket = buckets.get(start)
+                if bucket is not None:
+                    pairs.append((start, bucket))
+            end = min(end, max(first, oldest))
+            if first <= since:
+                break
+        return pairs
+
+    def clear(self):
+        with self.lock:
+            self.totals = {dimension: {} for dimension in WEBHOOK_STATS_DIMENSIONS}
+            self.buckets = [{} for _ in WEBHOOK_STATS_RESOLUTIONS]
+            self.events = 0
+
+    def replay(self, events, last_seq):
+        """Count the events a durable store kept from before a restart"""
+        self.replaying = True
+        try:
+            since = 0
+            while since < last_seq:
+                page, _, page_last = events.page(since, 1000)
+                if not page:
+                    break
+                for encoded in page:
+                    event = json.loads(encoded)
+                    if event['seq'] <= last_seq:
+                        self.add(event)
+                since = page_last
+        finally:
+            self.replaying = False
+
+
+webhook_aggregates = WebhookAggregates()
+
+
+@app.before_request
+def open_webhook_store():
+    """Open the durable log on the first request (not at import, so the reloader parent stays idle)"""
+    if isinstance(webhook_events, WebhookEventLog) and webhook_events.open() and len(webhook_events):
+        # Events stored before now are counted in the background; new ones are
+        # counted as they arrive, so nothing is counted twice
+        threading.Thread(
+            target=webhook_aggregates.replay, args=(webhook_events, webhook_events.next_seq - 1),
+            name='webhook-stats-replay', daemon=True
+        ).start()
+
+
+# ============================================================================
+# WEBHOOK PROCESSING (background workers)
+# ============================================================================
+
+# GitHub waits only a few seconds for an answer and redelivers when it times
+# out, so the endpoint only validates and queues a push; a small pool of
+# worker threads does the logging and storing. The queue is bounded: when
+# the workers fall WEBHOOK_QUEUE_SIZE events behind, new deliveries get a
+# 503 instead of piling up in memory.
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+# Seconds GitHub (or any client) is asked to wait before retrying on a 503
+WEBHOOK_RETRY_AFTER = 5
+
+webhook_queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+webhook_stats = Counter()
+webhook_stats_lock = threading.Lock()
+webhook_workers = []
+webhook_workers_lock = threading.Lock()
+
+
+def count_webhook(name):
+    with webhook_stats_lock:
+        webhook_stats[name] += 1
+
+
+def start_webhook_workers():
+    """Start the worker pool on first use (not at import, so the reloader parent stays idle)"""
+    with webhook_workers_lock:
+        while len(webhook_workers) < WEBHOOK_WORKERS:
+            worker = threading.Thread(
+                target=webhook_worker, name=f'webhook-worker-{len(webhook_workers) + 1}', daemon=True
+            )
+            worker.start()
+            webhook_workers.append(worker)
+
+
+def process_push_event(data):
+    """Log a GitHub push payload and store it for /webhooks/events"""
     # Extract repository info from real GitHub payload
     repository = data.get('repository', {})
     repo_name = repository.get('full_name', 'unknown') if repository else 'unknown'
@@ -116,22 +924,26 @@ def github_webhook():
     # Extract ref (which branch was pushed)
     ref = data.get('ref', 'unknown')
 
-    # Log the webhook with detailed output
-    print(f"\n{'='*60}")
-    print(f"🎉 REAL GitHub Webhook Received!")
-    print(f"📦 Repository: {repo_name}")
-    print(f"👤 Pushed by: {pusher_name}")
-    print(f"🌿 Branch: {ref}")
-    print(f"📝 Commits: {len(commits)}")
+    # Log the webhook with detailed output. Built as one string and printed
+    # at once, so output from concurrent workers does not interleave.
+    lines = [
+        f"\n{'='*60}",
+        f"🎉 REAL GitHub Webhook Received!",
+        f"📦 Repository: {repo_name}",
+        f"👤 Pushed by: {pusher_name}",
+        f"🌿 Branch: {ref}",
+        f"📝 Commits: {len(commits)}",
+    ]
 
     # Show details of each commit
     for i, commit in enumerate(commits, 1):
         commit_msg = commit.get('message', 'No message')
         commit_id = commit.get('id', 'unknown')[:7]  # Short SHA (first 7 chars)
         author = commit.get('author', {}).get('name', 'unknown')
-        print(f"   {i}. [{commit_id}] {commit_msg} (by {author})")
+        lines.append(f"   {i}. [{commit_id}] {commit_msg} (by {author})")
 
-    print(f"{'='*60}\n")
+    lines.append(f"{'='*60}\n")
+    print('\n'.join(lines))
 
     # Store the event for later viewing via /webhooks/events
     webhook_event = {
@@ -140,13 +952,172 @@ def github_webhook():
         'pusher': pusher_name,
         'ref': ref,
         'commits_count': len(commits),
-        'commit_messages': [c.get('message', '') for c in commits]
+        'commit_messages': [c.get('message', '') for c in commits],
+        'received_at': round(time.time(), 3)
     }
     webhook_events.append(webhook_event)
+    webhook_aggregates.add(webhook_event)
+
+
+def webhook_worker():
+    """Process queued push payloads until the process exits"""
+    while True:
+        data = webhook_queue.get()
+        try:
+            process_push_event(data)
+            count_webhook('processed')
+        except Exception as e:  # one bad payload must not stop the worker
+            count_webhook('failed')
+            app.logger.error(f'Failed to process webhook: {e}')
+        finally:
+            webhook_queue.task_done()
+
+
+# ============================================================================
+# WEBHOOK VERIFICATION (signatures and redeliveries)
+# ============================================================================
+
+# With a secret configured on the GitHub webhook, every delivery carries
+# X-Hub-Signature-256: an HMAC-SHA256 of the raw body. Set the same secret
+# here to refuse anything else; leave it empty to accept unsigned deliveries
+# (for curl testing). Both checks below look only at headers and raw bytes,
+# so forged and repeated deliveries are turned away before the JSON parse.
+GITHUB_WEBHOOK_SECRET = os.environ.get('GITHUB_WEBHOOK_SECRET', '').encode()
+# X-GitHub-Delivery IDs seen this recently are answered as duplicates
+WEBHOOK_DEDUPE_SECONDS = int(os.environ.get('WEBHOOK_DEDUPE_SECONDS', 3600))
+WEBHOOK_DEDUPE_BUCKETS = 6
+
+
+def signature_valid(body, signature):
+    """True when `signature` (the X-Hub-Signature-256 header) matches the body"""
+    if not GITHUB_WEBHOOK_SECRET:
+        return True
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(GITHUB_WEBHOOK_SECRET, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature[len('sha256='):], expected)
+
+
+class DeliveryDedupe:
+    """
+    Delivery IDs seen in the last `window` seconds.
+
+    IDs go into one set per window / buckets seconds; a whole bucket is
+    dropped when it ages out, so nothing is tracked per ID and memory is
+    bounded by the delivery rate.
+    """
+
+    def __init__(self, window, buckets):
+        self.bucket_seconds = window / buckets
+        self.buckets = buckets
+        self.sets = {}  # bucket number -> delivery IDs
+        self.lock = threading.Lock()
+
+    def current_bucket(self):
+        bucket = int(time.time() // self.bucket_seconds)
+        for old in [old for old in self.sets if old <= bucket - self.buckets]:
+            del self.sets[old]
+        return bucket
+
+    def seen(self, delivery_id):
+        with self.lock:
+            self.current_bucket()
+            return any(delivery_id in ids for ids in self.sets.values())
+
+    def add(self, delivery_id):
+        """Record a delivery; False when it was already recorded"""
+        with self.lock:
+            bucket = self.current_bucket()
+            if any(delivery_id in ids for ids in self.sets.values()):
+                return False
+            self.sets.setdefault(bucket, set()).add(delivery_id)
+            return True
+
+    def forget(self, delivery_id):
+        """Let a delivery we could not take be retried"""
+        with self.lock:
+            for ids in self.sets.values():
+                ids.discard(delivery_id)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(ids) for ids in self.sets.values())
+
+
+webhook_deliveries = DeliveryDedupe(WEBHOOK_DEDUPE_SECONDS, WEBHOOK_DEDUPE_BUCKETS)
+
+
+# ============================================================================
+# GITHUB WEBHOOK ENDPOINT - COMPLETE SOLUTION
+# ============================================================================
+
+@app.route('/webhooks/github', methods=['POST'])
+def github_webhook():
+    """
+    Receives REAL push events from GitHub.
 
-    # GitHub expects 200 status to acknowledge receipt
-    # If you return non-2xx, GitHub will mark the webhook as failed
-    return jsonify({'status': 'received', 'commits_processed': len(commits)}), 200
+    When you configure a webhook in GitHub repository settings, it sends POST
+    requests to this endpoint with information about repository events.
+    Pushes are acknowledged with 202 as soon as they are queued and
+    processed by the webhook workers (see WEBHOOK PROCESSING).
+
+    Deliveries with a wrong signature get 401 and redeliveries of one we
+    already have get 200 without being processed again (see WEBHOOK
+    VERIFICATION); neither is parsed.
+
+    Official documentation: https://docs.github.com/en/webhooks/webhook-events-and-payloads
+    """
+    delivery_id = request.headers.get('X-GitHub-Delivery')
+    # Cheapest first: a known delivery ID is answered before the body is read
+    if delivery_id and webhook_deliveries.seen(delivery_id):
+        count_webhook('duplicate')
+        return jsonify({'status': 'duplicate', 'delivery': delivery_id}), 200
+
+    body = request.get_data(cache=True)
+    if not signature_valid(body, request.headers.get('X-Hub-Signature-256')):
+        count_webhook('forged')
+        return jsonify({'error': 'Invalid signature'}), 401
+
+    # Checked again now that it is verified: a concurrent copy may have won
+    if delivery_id and not webhook_deliveries.add(delivery_id):
+        count_webhook('duplicate')
+        return jsonify({'status': 'duplicate', 'delivery': delivery_id}), 200
+
+    data = request.get_json(silent=True)
+
+    if not isinstance(data, dict) or not data:
+        # Not processed, so a corrected redelivery must not count as a duplicate
+        if delivery_id:
+            webhook_deliveries.forget(delivery_id)
+        return jsonify({'error': 'Invalid payload'}), 400
+
+    # Handle GitHub "ping" event (sent when webhook is first created)
+    # This confirms your webhook endpoint is reachable
+    if 'zen' in data and 'hook_id' in data:
+        print(f"\n{'='*60}")
+        print(f"📥 GitHub Webhook Ping Received!")
+        print(f"   Hook ID: {data.get('hook_id')}")
+        print(f"   Zen: {data.get('zen')}")
+        print(f"   ✅ Webhook is configured correctly!")
+        print(f"{'='*60}\n")
+        return jsonify({'status': 'pong'}), 200
+
+    start_webhook_workers()
+    try:
+        webhook_queue.put_nowait(data)
+    except queue.Full:
+        # Backpressure: GitHub records the failure and the delivery can be retried
+        if delivery_id:
+            webhook_deliveries.forget(delivery_id)
+        count_webhook('rejected')
+        return jsonify({
+            'error': 'Webhook queue is full',
+            'message': 'Too many deliveries are waiting to be processed, try again later'
+        }), 503, {'Retry-After': str(WEBHOOK_RETRY_AFTER)}
+
+    count_webhook('accepted')
+    # GitHub treats any 2xx as delivered; 202 says processing happens later
+    return jsonify({'status': 'accepted', 'queued': webhook_queue.qsize()}), 202
 
 
 # ============================================================================
@@ -156,24 +1127,173 @@ def github_webhook():
 @app.route('/webhooks/events', methods=['GET'])
 def list_webhook_events():
     """
-    Returns all received webhook events.
+    Returns received webhook events, oldest first, a page at a time.
     Useful for debugging and verifying webhooks were received.
+
+    Query parameters:
+        since: only events after this sequence number (default 0)
+        limit: events per page (default 100, at most 1000)
+
+    Poll with since=<next_since> from the previous answer to get only new
+    events. A first_seq above since + 1 means older events were dropped.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', WEBHOOK_EVENTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since < 0 or limit < 1:
+        return jsonify({'error': 'since must be >= 0 and limit >= 1'}), 400
+    limit = min(limit, WEBHOOK_EVENTS_MAX_PAGE_SIZE)
+
+    events, first_seq, last_seq = webhook_events.page(since, limit)
+    stats = webhook_events.snapshot()
+    # The events are already JSON; only the envelope is encoded here
+    envelope = json.dumps({
+        'total_events': stats['stored_events'],
+        'first_seq': stats['first_seq'],
+        'last_seq': stats['last_seq'],
+        'next_since': last_seq if events else max(since, first_seq - 1),
+        'has_more': bool(events) and last_seq < stats['last_seq']
+    })
+    body = envelope[:-1].encode() + b', "events": [' + b','.join(events) + b']}'
+    return app.response_class(body, status=200, mimetype='application/json')
+
+
+@app.route('/webhooks/stream', methods=['GET'])
+def webhook_event_stream():
+    """
+    Streams webhook events as they are stored, as Server-Sent Events.
+
+    Each event is sent with its sequence number as the SSE id, so a
+    reconnecting EventSource resumes after the last event it saw
+    (Last-Event-ID header, or ?last_event_id= for the first connection).
+    Without either, the stream starts with the next event.
+
+    Browser usage:
+        const events = new EventSource('/webhooks/stream');
+        events.addEventListener('push', e => console.log(JSON.parse(e.data)));
+    """
+    last_seq = webhook_events.snapshot()['last_seq']
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        # An id from before a restart of the in-memory store may be ahead of it
+        cursor = last_seq if last_event_id is None else min(int(last_event_id), last_seq)
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an event sequence number'}), 400
+
+    if not webhook_stream.subscribe():
+        return jsonify({'error': 'Too many stream subscribers'}), 503, {'Retry-After': '30'}
+
+    # The development server exposes the connection's socket; other servers may not
+    connection = request.environ.get('werkzeug.socket')
+    if connection is not None:
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, WEBHOOK_STREAM_SOCKET_BUFFER)
+
+    response = Response(webhook_stream.follow(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # no proxy buffering of the stream
+    })
+    # Runs when the stream ends or the client goes away, even before the first event
+    response.call_on_close(webhook_stream.unsubscribe)
+    return response
+
+
+@app.route('/webhooks/stats', methods=['GET'])
+def webhook_statistics():
+    """
+    Push and commit counts per group, from counters kept up to date as
+    events arrive (see WEBHOOK STATISTICS).
+
+    Query parameters:
+        group_by: repository, pusher, branch, minute, hour or day (default repository)
+        window:   how far back, e.g. 30m, 1h, 7d, or all (default all); counted
+                  from the start of a minute up to 2d, of an hour beyond
+        repository / pusher / branch: count only that value, e.g.
+                  group_by=day&repository=octo/repo for commits per day of one repository
+        limit:    most groups returned, busiest first (default 50; time groups are all returned)
+
+    Examples:
+        /webhooks/stats?group_by=repository&window=1h
+        /webhooks/stats?group_by=pusher&window=7d&limit=10
+    """
+    group_by = request.args.get('group_by', 'repository')
+    if group_by not in WEBHOOK_STATS_DIMENSIONS and group_by not in WEBHOOK_STATS_TIME_GROUPS:
+        return jsonify({
+            'error': 'Unknown group_by',
+            'allowed': list(WEBHOOK_STATS_DIMENSIONS) + list(WEBHOOK_STATS_TIME_GROUPS)
+        }), 400
+
+    window_arg = request.args.get('window', 'all')
+    window = None
+    if window_arg != 'all':
+        match = WINDOW_PATTERN.match(window_arg)
+        if not match:
+            return jsonify({'error': 'window must look like 30m, 1h or 7d, or be all'}), 400
+        window = int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+
+    filters = [(dimension, request.args[dimension]) for dimension in WEBHOOK_STATS_DIMENSIONS
+               if dimension in request.args]
+    if len(filters) > 1:
+        return jsonify({'error': 'Filter on one of repository, pusher or branch at a time'}), 400
+    dimension, value = filters[0] if filters else (None, None)
+
+    try:
+        limit = int(request.args.get('limit', WEBHOOK_STATS_DEFAULT_LIMIT))
+        groups = webhook_aggregates.query(group_by, window, dimension, value)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if group_by in WEBHOOK_STATS_TIME_GROUPS:
+        keys = sorted(groups)
+        labels = {key: datetime.fromtimestamp(key, timezone.utc).isoformat() for key in keys}
+    else:
+        keys = sorted(groups, key=lambda key: (-groups[key][1], -groups[key][0], key))[:max(limit, 0)]
+        labels = {key: key for key in keys}
+
+    return jsonify({
+        'group_by': group_by,
+        'window': window_arg,
+        'filter': {dimension: value} if dimension else None,
+        'total_pushes': sum(pushes for pushes, _ in groups.values()),
+        'total_commits': sum(commits for _, commits in groups.values()),
+        'groups': [{group_by: labels[key], 'pushes': groups[key][0], 'commits': groups[key][1]}
+                   for key in keys],
+        'counting_stored_events': webhook_aggregates.replaying
+    }), 200
+
+
+@app.route('/webhooks/queue', methods=['GET'])
+def webhook_queue_status():
+    """
+    Shows how far behind the webhook workers are.
     """
+    with webhook_stats_lock:
+        stats = dict(webhook_stats)
     return jsonify({
-        'total_events': len(webhook_events),
-        'events': webhook_events
+        'store': webhook_events.snapshot(),
+        'stream': webhook_stream.snapshot(),
+        'queued': webhook_queue.qsize(),
+        'capacity': WEBHOOK_QUEUE_SIZE,
+        'workers': len(webhook_workers),
+        'accepted': stats.get('accepted', 0),
+        'processed': stats.get('processed', 0),
+        'failed': stats.get('failed', 0),
+        'rejected': stats.get('rejected', 0),
+        'duplicate': stats.get('duplicate', 0),
+        'forged': stats.get('forged', 0),
+        'tracked_deliveries': len(webhook_deliveries)
     }), 200
 
 
 @app.route('/webhooks/events/clear', methods=['POST'])
 def clear_webhook_events():
     """
-    Clears all stored webhook events.
+    Clears all stored webhook events and the statistics counted from them.
     Useful for testing - start fresh.
     """
-    global webhook_events
-    count = len(webhook_events)
-    webhook_events = []
+    count = webhook_events.clear()
+    webhook_aggregates.clear()
     return jsonify({
         'message': f'Cleared {count} webhook events',
         'remaining': 0
@@ -194,20 +1314,26 @@ def log_request():
     if request.path in ['/favicon.ico']:
         return
 
-    print(f"\n{'='*60}")
-    print(f"📨 Incoming Request:")
-    print(f"   Method: {request.method}")
-    print(f"   Path: {request.path}")
-    print(f"   From: {request.remote_addr}")
-    print(f"   User-Agent: {request.headers.get('User-Agent', 'Unknown')[:50]}")
+    # One print per request, so lines from concurrent requests and the
+    # webhook workers do not interleave
+    lines = [
+        f"\n{'='*60}",
+        f"📨 Incoming Request:",
+        f"   Method: {request.method}",
+        f"   Path: {request.path}",
+        f"   From: {request.remote_addr}",
+        f"   User-Agent: {request.headers.get('User-Agent', 'Unknown')[:50]}",
+    ]
 
-    # Show request body for POST/PUT requests
-    if request.method in ['POST', 'PUT', 'PATCH']:
+    # Show request body for POST/PUT requests. Webhook payloads are not
+    # touched here: they are verified first and logged by the webhook workers.
+    if request.method in ['POST', 'PUT', 'PATCH'] and request.path != '/webhooks/github':
         body = request.get_json(silent=True)
         if body:
-            print(f"   Body: {body}")
+            lines.append(f"   Body: {body}")
 
-    print(f"{'='*60}\n")
+    lines.append(f"{'='*60}\n")
+    print('\n'.join(lines))
 
 
 # ============================================================================
@@ -260,7 +1386,10 @@ if __name__ == '__main__':
     print("  GET  /users                 - List users")
     print("  POST /users                 - Create user")
     print("  POST /webhooks/github       - GitHub push webhook (MAIN ENDPOINT)")
-    print("  GET  /webhooks/events       - List all received webhooks")
+    print("  GET  /webhooks/events       - Received webhooks (?since=<seq>&limit=)")
+    print("  GET  /webhooks/stream       - Live events (Server-Sent Events)")
+    print("  GET  /webhooks/stats        - Counts (?group_by=repository&window=1h)")
+    print("  GET  /webhooks/queue        - Webhook processing backlog")
     print("  POST /webhooks/events/clear - Clear webhook history")
     print("\nFor detailed instructions, see readme11.md")
     print("="*70 + "\n")
@@ -0,0 +1,463 @@
+"""
+Load test for the GitHub webhook endpoint.
+
+Starts example11.py on a free port, sends generated GitHub push deliveries
+to POST /webhooks/github from many concurrent clients, and prints how long
+the app took to acknowledge them (what GitHub's delivery timeout measures)
+plus the final webhook queue state. Nothing touches GitHub.
+
+    python webhook_load_test.py                             # 2000 pushes, 50 clients
+    python webhook_load_test.py --commits 20 --requests 5000
+    python webhook_load_test.py --app /tmp/example11_before.py   # compare another version
+    python webhook_load_test.py --console-rate 500      # app output read at 500 KB/s, like a terminal
+    python webhook_load_test.py --rounds 20 --requests 5000   # soak: memory after each round
+    python webhook_load_test.py --store memory --fsync never  # ring buffer / no fsync
+    python webhook_load_test.py --secret s3cret --duplicate-rate 0.3 --forged-rate 0.1
+    python webhook_load_test.py --subscribers 50 --slow-subscribers 5   # GET /webhooks/stream clients
+    python webhook_load_test.py --target http://127.0.0.1:5000   # an app you started
+
+Standard library only.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+EXAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs an app file without its __main__ block (no debug reloader, no banner)
+LAUNCHER = (
+    'import runpy, sys; '
+    "app = runpy.run_path(sys.argv[1])['app']; "
+    'app.run(port=int(sys.argv[2]), threaded=True)'
+)
+
+REPOSITORIES = ('octo-org/api', 'octo-org/web', 'octo-org/docs', 'octocat/hello-world', 'octocat/spoon-knife')
+PUSHERS = ('octocat', 'monalisa', 'hubot', 'dependabot', 'alice', 'bob')
+BRANCHES = ('refs/heads/main', 'refs/heads/develop', 'refs/heads/feature/login', 'refs/heads/fix/typo')
+
+
+# ============================================================================
+# PROCESSES
+# ============================================================================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'The app exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f'Nothing is listening on port {port} after {timeout}s')
+
+
+def start(stack, command, port, env=None, stdout=subprocess.DEVNULL):
+    """Start a process that is terminated when the stack closes"""
+    process = subprocess.Popen(command, cwd=EXAMPLE_DIR, env=env, stdout=stdout, stderr=subprocess.DEVNULL)
+    stack.callback(process.wait, timeout=10)
+    stack.callback(process.terminate)
+    wait_for_port(port, process)
+    return process
+
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux only; None elsewhere)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def drain(pipe, rate):
+    """Read a process's output at `rate` bytes/s, as a busy terminal would"""
+    chunk = 4096
+    while pipe.read(chunk):
+        time.sleep(chunk / rate)
+
+
+# ============================================================================
+# HTTP CLIENT
+# ============================================================================
+
+class Connection:
+    """A minimal HTTP/1.1 keep-alive client connection (no pool, no overhead)"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """Return (status, headers, body); reconnects when the server closed"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n'
+        for name, value in (headers or {}).items():
+            head += f'{name}: {value}\r\n'
+        self.writer.write(head.encode() + b'\r\n' + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('server closed the connection')
+        version, status = status_line.split()[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in response_headers:
+            response_body = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            response_body = await self.reader.read()
+        if version == b'HTTP/1.0' or response_headers.get('connection', '').lower() == 'close' \
+                or 'content-length' not in response_headers:
+            self.close()
+        return int(status), response_headers, response_body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def timed_get(host, port, path):
+    """(seconds, response bytes) for one GET on a fresh connection"""
+    connection = Connection(host, port)
+    try:
+        started = time.perf_counter()
+        _, _, body = await connection.request('GET', path)
+        return time.perf_counter() - started, len(body)
+    finally:
+        connection.close()
+
+
+async def fetch_json(host, port, path):
+    connection = Connection(host, port)
+    try:
+        status, _, body = await connection.request('GET', path)
+        return json.loads(body) if status == 200 else None
+    finally:
+        connection.close()
+
+
+# ============================================================================
+# DELIVERIES
+# ============================================================================
+
+def push_payload(rng, commits):
+    """A push event shaped like GitHub's (only the fields the app reads, plus some bulk)"""
+    pusher = rng.choice(PUSHERS)
+    return {
+        'ref': rng.choice(BRANCHES),
+        'before': uuid.UUID(int=rng.getrandbits(128)).hex + '00000000',
+        'after': uuid.UUID(int=rng.getrandbits(128)).hex + '00000000',
+        'repository': {'full_name': rng.choice(REPOSITORIES), 'private': False, 'default_branch': 'main'},
+        'pusher': {'name': pusher, 'email': f'{pusher}@example.com'},
+        'commits': [{
+            'id': uuid.UUID(int=rng.getrandbits(128)).hex + '00000000',
+            'message': f'Change {rng.randrange(10000)}: update {rng.choice(("docs", "tests", "api", "ui"))}',
+            'timestamp': '2026-10-18T12:00:00Z',
+            'author': {'name': pusher, 'email': f'{pusher}@example.com'},
+            'added': [], 'removed': [], 'modified': [f'src/module_{rng.randrange(50)}.py'],
+        } for _ in range(commits)],
+    }
+
+
+def deliveries(count, commits, seed, secret=b'', duplicate_rate=0.0, forged_rate=0.0):
+    """
+    (headers, body) pairs for `count` push deliveries. With a secret they are
+    signed; duplicate_rate of them repeat an earlier delivery (GitHub
+    redelivering) and forged_rate carry a wrong signature.
+    """
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        if result and rng.random() < duplicate_rate:
+            result.append(rng.choice(result))
+            continue
+        body = json.dumps(push_payload(rng, rng.randint(1, commits))).encode()
+        headers = {
+            'Content-Type': 'application/json',
+            'X-GitHub-Event': 'push',
+            'X-GitHub-Delivery': str(uuid.UUID(int=rng.getrandbits(128))),
+        }
+        if secret:
+            signed = b'forged' + body if rng.random() < forged_rate else body
+            headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(secret, signed, hashlib.sha256).hexdigest()
+        result.append((headers, body))
+    return result
+
+
+# ============================================================================
+# LOAD
+# ============================================================================
+
+async def run_load(host, port, requests, concurrency):
+    """Send every delivery from `concurrency` keep-alive clients; returns per-request results"""
+    results = []
+    queue = iter(requests)
+
+    async def client():
+        connection = Connection(host, port)
+        for headers, body in queue:
+            started = time.perf_counter()
+            try:
+                status, _, _ = await connection.request('POST', '/webhooks/github', body, headers)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                connection.close()
+                status = 'error'
+            results.append((time.perf_counter() - started, status))
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+class Subscriber:
+    """An EventSource-like GET /webhooks/stream client that reconnects with Last-Event-ID"""
+
+    def __init__(self, host, port, delay=0.0):
+        self.host, self.port, self.delay = host, port, delay
+        self.last_id = None
+        self.received = self.gaps = self.duplicates = self.reconnects = 0
+        self.latencies = []
+
+    async def run(self):
+        while True:
+            headers = f'Last-Event-ID: {self.last_id}\r\n' if self.last_id is not None else ''
+            try:
+                sock = socket.socket()
+                if self.delay:
+                    # A small receive window, so a slow reader pushes back on
+                    # the server instead of loopback buffering megabytes for it
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                sock.setblocking(False)
+                await asyncio.get_running_loop().sock_connect(sock, (self.host, self.port))
+                reader, writer = await asyncio.open_connection(sock=sock, limit=4096)
+            except OSError:
+                await asyncio.sleep(0.5)
+                continue
+            try:
+                # HTTP/1.0, so the stream arrives as it is (not chunked) until the server closes
+                writer.write(f'GET /webhooks/stream HTTP/1.0\r\nHost: {self.host}\r\n{headers}\r\n'.encode())
+                while await reader.readline() not in (b'\r\n', b''):
+                    pass  # status line and headers
+                event_id = None
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    if line.startswith(b'id: '):
+                        event_id = int(line[4:])
+                    elif line.startswith(b'data: ') and event_id is not None:
+                        self.receive(event_id, line[6:])
+                        event_id = None
+                        if self.delay:
+                            await asyncio.sleep(self.delay)
+            finally:
+                writer.close()
+            self.reconnects += 1  # dropped as too slow, or the server closed the stream
+
+    def receive(self, event_id, data):
+        if self.last_id is not None:
+            if event_id <= self.last_id:
+                self.duplicates += 1
+                return
+            if event_id != self.last_id + 1:
+                self.gaps += 1
+        self.last_id = event_id
+        self.received += 1
+        if not self.delay:
+            # received_at is the last field; cheaper to cut out than to parse the event
+            received_at = data[data.rindex(b'"received_at":') + 14:].split(b',', 1)[0].rstrip(b'}\r\n')
+            self.latencies.append(time.time() - float(received_at))
+
+
+async def run_session(args, host, port, pid, requests):
+    """Run the load rounds with stream subscribers connected; returns (results, elapsed, subscriber stats)"""
+    subscribers = [Subscriber(host, port, args.slow_delay if i < args.slow_subscribers else 0.0)
+                   for i in range(args.subscribers)]
+    tasks = [asyncio.create_task(subscriber.run()) for subscriber in subscribers]
+    memory = {}
+    if subscribers:
+        memory['before'] = rss_mb(pid) if pid else None
+        await asyncio.sleep(1.0)
+        memory['connected'] = rss_mb(pid) if pid else None
+
+    results, elapsed = [], 0.0
+    for number in range(1, args.rounds + 1):
+        round_results, round_elapsed = await run_load(host, port, requests, args.concurrency)
+        results += round_results
+        elapsed += round_elapsed
+        if args.rounds > 1:
+            report_round(number, pid, *await timed_get(host, port, '/webhooks/events'))
+
+    if subscribers:
+        # Wait for the workers to store everything, then for the fast subscribers to see it
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            state = await fetch_json(host, port, '/webhooks/queue')
+            if state['queued'] == 0 and state['processed'] + state['failed'] >= state['accepted']:
+                break
+            await asyncio.sleep(0.2)
+        last_seq = state['store']['last_seq']
+        while time.monotonic() < deadline and any(
+                subscriber.last_id != last_seq for subscriber in subscribers if not subscriber.delay):
+            await asyncio.sleep(0.1)
+        memory['last_seq'] = last_seq
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results, elapsed, subscribers, memory
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def report_round(number, pid, events_time, events_size):
+    memory = rss_mb(pid) if pid else None
+    print(f'Round {number:>3}:   RSS {f"{memory:.1f} MB" if memory is not None else "n/a"}  '
+          f'GET /webhooks/events {events_time * 1000:.1f} ms, {events_size / 1024:.0f} KB', flush=True)
+
+
+def report_stream(args, subscribers, memory):
+    fast = [subscriber for subscriber in subscribers if not subscriber.delay]
+    slow = [subscriber for subscriber in subscribers if subscriber.delay]
+    print(f'Stream:      {len(fast)} subscribers + {len(slow)} reading an event every {args.slow_delay:g} s, '
+          f'{memory["last_seq"]} events stored')
+    if fast:
+        latencies = sorted(latency for subscriber in fast for latency in subscriber.latencies)
+        print(f'  fast:      received {min(s.received for s in fast)}-{max(s.received for s in fast)}  '
+              f'gaps {sum(s.gaps for s in fast)}  duplicates {sum(s.duplicates for s in fast)}  '
+              f'reconnects {sum(s.reconnects for s in fast)}  up to date {sum(s.last_id == memory["last_seq"] for s in fast)}')
+        if latencies:
+            print(f'  delivery:  p50 {percentile(latencies, 0.5) * 1000:.1f} ms  '
+                  f'p99 {percentile(latencies, 0.99) * 1000:.1f} ms (stored -> received)')
+    if slow:
+        print(f'  slow:      received {min(s.received for s in slow)}-{max(s.received for s in slow)}  '
+              f'gaps {sum(s.gaps for s in slow)}  duplicates {sum(s.duplicates for s in slow)}  '
+              f'dropped and reconnected {sum(s.reconnects for s in slow)}')
+    if memory.get('before') is not None:
+        print(f'  memory:    RSS {memory["before"]:.1f} MB -> {memory["connected"]:.1f} MB with '
+              f'{len(subscribers)} connected ({(memory["connected"] - memory["before"]) * 1024 / len(subscribers):.0f} KB each)')
+
+
+def report(args, app, results, elapsed, queue_state):
+    latencies = sorted(latency for latency, _ in results)
+    statuses = Counter(status for _, status in results)
+    by_status = {}
+    for latency, status in results:
+        by_status.setdefault(status, []).append(latency)
+
+    def ms(value):
+        return f'{value * 1000:.1f} ms'
+
+    print(f'App:         {app} (events: {args.store}, fsync {args.fsync})')
+    print(f'Requests:    {len(results)} pushes (1-{args.commits} commits) at concurrency {args.concurrency}, '
+          f'console {f"{args.console_rate:g} KB/s" if args.console_rate else "file"}, '
+          f'{"signed" if args.secret else "unsigned"}, duplicates {args.duplicate_rate:g}, forged {args.forged_rate:g}')
+    print(f'Throughput:  {len(results) / elapsed:.1f} req/s in {elapsed:.2f} s')
+    print(f'Ack latency: p50 {ms(percentile(latencies, 0.5))}  p90 {ms(percentile(latencies, 0.9))}  '
+          f'p99 {ms(percentile(latencies, 0.99))}  max {ms(latencies[-1])}')
+    print('Status:      ' + '  '.join(f'{status}: {n}' for status, n in sorted(statuses.items(), key=str)))
+    if len(by_status) > 1:
+        for status, values in sorted(by_status.items(), key=lambda item: str(item[0])):
+            values.sort()
+            print(f'  {status}:       p50 {ms(percentile(values, 0.5))}  p99 {ms(percentile(values, 0.99))}')
+    if queue_state is not None:
+        store, stream = queue_state.pop('store', None), queue_state.pop('stream', None)
+        print('Queue:       ' + '  '.join(f'{name}: {value}' for name, value in queue_state.items()))
+        if store is not None:
+            print('Store:       ' + '  '.join(f'{name}: {value}' for name, value in store.items()))
+        if stream is not None:
+            print('Subscribers: ' + '  '.join(f'{name}: {value}' for name, value in stream.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test POST /webhooks/github with generated push events')
+    parser.add_argument('--app', default=os.path.join(EXAMPLE_DIR, 'example11.py'),
+                        help='app file to start (default example11.py)')
+    parser.add_argument('--target', help='URL of an already running app (skips starting one)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--commits', type=int, default=10, help='most commits per push')
+    parser.add_argument('--console-rate', type=float, default=0,
+                        help="KB/s at which the app's output is read; 0 writes it to a file")
+    parser.add_argument('--store', choices=('log', 'memory'), default='log',
+                        help='events in a fresh on-disk log (WEBHOOK_LOG_DIR) or only in memory')
+    parser.add_argument('--fsync', choices=('batch', 'interval', 'never'), default='batch',
+                        help="the app's WEBHOOK_LOG_FSYNC")
+    parser.add_argument('--secret', default='', help="sign deliveries; also the app's GITHUB_WEBHOOK_SECRET")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='fraction of deliveries sent again')
+    parser.add_argument('--forged-rate', type=float, default=0.0, help='fraction with a wrong signature (needs --secret)')
+    parser.add_argument('--rounds', type=int, default=1,
+                        help='send the deliveries this many times, reporting memory after each round')
+    parser.add_argument('--subscribers', type=int, default=0, help='GET /webhooks/stream clients during the load')
+    parser.add_argument('--slow-subscribers', type=int, default=0, help='how many of them read slowly')
+    parser.add_argument('--slow-delay', type=float, default=0.05, help='seconds a slow subscriber takes per event')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    requests = deliveries(args.requests, args.commits, args.seed,
+                          args.secret.encode(), args.duplicate_rate, args.forged_rate)
+
+    with ExitStack() as stack:
+        if args.target:
+            target = urlsplit(args.target)
+            host, port, app, pid = target.hostname, target.port or 80, args.target, None
+        else:
+            host, port, app = '127.0.0.1', free_port(), os.path.relpath(args.app, EXAMPLE_DIR)
+            # The app prints every push: to a file like a log, or to a pipe
+            # drained slowly like the terminal the app usually runs in
+            output = subprocess.PIPE if args.console_rate else stack.enter_context(tempfile.TemporaryFile())
+            # A fresh event log per run, so every run starts empty
+            log_dir = os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), 'log') \
+                if args.store == 'log' else ''
+            env = dict(os.environ, PYTHONUNBUFFERED='1', WEBHOOK_LOG_DIR=log_dir, WEBHOOK_LOG_FSYNC=args.fsync,
+                       GITHUB_WEBHOOK_SECRET=args.secret)
+            process = start(stack, [sys.executable, '-c', LAUNCHER, os.path.abspath(args.app), str(port)],
+                            port, env, stdout=output)
+            if args.console_rate:
+                threading.Thread(target=drain, args=(process.stdout, args.console_rate * 1024), daemon=True).start()
+            pid = process.pid
+
+        results, elapsed, subscribers, memory = asyncio.run(run_session(args, host, port, pid, requests))
+        queue_state = asyncio.run(fetch_json(host, port, '/webhooks/queue'))
+
+    report(args, app, results, elapsed, queue_state)
+    if subscribers:
+        report_stream(args, subscribers, memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
+import os
+import sys
+
 from flask import Flask, request
-from flask_restx import Api, Resource, fields, Namespace
+from flask_restx import Resource, fields
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Compiled marshalling, the cached spec and the precompressed Swagger UI,
+# shared with the other Flask-RESTX exercise (see exercises/shared/compiled_restx.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from compiled_restx import CompiledApi, precompress_swagger_ui
+
 app = Flask(__name__)
 
 # JWT Configuration
@@ -21,7 +29,7 @@ authorizations = {
 }
 
 # Initialize the Api object with full configuration
-api = Api(
+api = CompiledApi(
     app,
     version='1.0',
     title='User Management API',
@@ -30,10 +38,14 @@ api = Api(
     authorizations=authorizations
 )
 
+# Serve the Swagger UI bundles precompressed, from long-cached URLs
+precompress_swagger_ui(app)
+
 # Simulated database to store users
 users = {}
 
 # Create namespaces to organize endpoints
+# (CompiledApi namespaces serialize with per-model compiled functions)
 auth_ns = api.namespace('auth', description='Authentication operations')
 users_ns = api.namespace('users', description='User management operations')
 
@@ -0,0 +1,215 @@
+"""
+Benchmark for the compiled marshalling, validation and parsing used by
+documented_api.py (exercises/shared/compiled_restx.py).
+
+Generates items for every model of the app, checks that each compiled
+serializer returns exactly what flask_restx.marshal() returns (same dict,
+same JSON bytes) and times both. GET /api/books is also checked end to
+end against the generic marshaller.
+
+Payload validation and query-string parsing are checked the same way:
+valid and invalid BookInput payloads and /api/books query strings must
+give the same result (or the same 400 error) as Model.validate() and
+RequestParser.parse_args(), and the cost per request of each is printed.
+Exits with status 1 on any mismatch.
+
+    python benchmark.py                  # 10k items per model
+    python benchmark.py --items 50000
+
+Nothing is started on a port; requests go through Flask's test client.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from flask_restx import Model, fields, marshal
+from flask_restx.marshalling import make
+from flask_restx.representations import output_json
+from werkzeug.exceptions import HTTPException
+
+import documented_api
+from compiled_restx import compile_model  # on sys.path once the app is imported
+
+# Query strings for GET /api/books: the common ones plus the ones parse_args() rejects
+BOOK_LIST_QUERIES = (
+    '', 'author=orwell', 'page=2&limit=5', 'author=Lee&page=1&limit=50', 'limit=0',
+    'page=abc', 'limit=1.5', 'page=1&page=2', 'author=', 'unknown=1',
+)
+
+
+
+# ============================================================================
+# ITEMS
+# ============================================================================
+
+def sample_value(field, rng):
+    """A value for field, including the odd types and None a client may send"""
+    field = make(field)
+    if isinstance(field, fields.Nested):
+        return None if rng.random() < 0.1 else sample_item(field.nested, rng)
+    if isinstance(field, fields.List):
+        return [sample_value(field.container, rng) for _ in range(rng.randrange(4))]
+    if isinstance(field, fields.Boolean):
+        return rng.choice((True, False, None, 0, 1))
+    if isinstance(field, fields.Integer):
+        return rng.choice((rng.randrange(3000), None, str(rng.randrange(3000)), True))
+    if isinstance(field, fields.String):
+        return rng.choice((f'text {rng.randrange(10 ** 6)}', None, rng.randrange(100), ''))
+    return rng.choice((rng.randrange(100), 'raw', None, [1, 2]))
+
+
+def sample_payload(rng):
+    """A BookInput payload: mostly valid, sometimes wrong in one of the usual ways"""
+    payload = {'title': f'Book {rng.randrange(10 ** 6)}', 'author': rng.choice(('Orwell', 'Lee', 'Austen')),
+               'year': rng.randrange(1800, 2030), 'isbn': f'978-{rng.randrange(10 ** 10):010d}'}
+    for key in ('year', 'isbn'):
+        if rng.random() < 0.3:
+            del payload[key]
+    mistake = rng.randrange(12)
+    if mistake == 0:
+        del payload['title']
+    elif mistake == 1:
+        payload['year'] = str(rng.randrange(1800, 2030))
+    elif mistake == 2:
+        payload['author'] = None
+    elif mistake == 3:
+        payload['year'] = rng.choice((True, 1949.0, None))
+    elif mistake == 4:
+        payload['extra'] = 'field'
+    elif mistake == 5:
+        payload = rng.choice(([payload], 'text', None))
+    return payload
+
+
+def sample_item(model, rng):
+    """A dict for model with some keys missing; now and then an object instead"""
+    item = {key: sample_value(field, rng) for key, field in model.resolved.items() if rng.random() < 0.9}
+    return SimpleNamespace(**item) if rng.random() < 0.02 else item
+
+
+# ============================================================================
+# CHECKS
+# ============================================================================
+
+def encode(data):
+    return json.dumps(data).encode()
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def check_model(model, items):
+    """Compare compile_model(model) with marshal() on items; return timings"""
+    serialize = compile_model(model)
+    for item in items:
+        expected, actual = marshal(item, model), serialize(item)
+        if actual != expected or encode(actual) != encode(expected):
+            raise SystemExit(f'{model.name}: compiled output differs for {item!r}:\n'
+                             f'  marshal:  {expected!r}\n  compiled: {actual!r}')
+    return best_of(lambda: marshal(items, model)), best_of(lambda: [serialize(item) for item in items])
+
+
+def check_books_endpoint(count, rng):
+    """GET /api/books must return the bytes the generic marshaller produces"""
+    book_model = documented_api.book_model
+    books = {i: sample_item(book_model, rng) for i in range(1, count + 1)}
+    books = {i: book for i, book in books.items() if isinstance(book, dict)}
+    documented_api.books.clear()
+    documented_api.books.update(books)
+
+    client = documented_api.app.test_client()
+    path = f'/api/books?limit={count}'
+    with documented_api.app.test_request_context():
+        expected = output_json(marshal(list(books.values()), book_model), 200).get_data()
+    actual = client.get(path).get_data()
+    if actual != expected:
+        raise SystemExit('GET /api/books: response body differs from marshal()')
+    return len(actual), best_of(lambda: client.get(path))
+
+
+def outcome(func, *args):
+    """The return value of func, or the status and body of the HTTP error it raised"""
+    try:
+        return 'ok', func(*args)
+    except HTTPException as error:
+        return error.code, getattr(error, 'data', None)
+
+
+def per_call(func, calls):
+    return best_of(lambda: [func() for _ in range(calls)]) / calls
+
+
+def check_validation(payloads):
+    """CompiledModel.validate() must accept and reject exactly what Model.validate() does"""
+    book_input = documented_api.book_input
+    for payload in payloads:
+        expected = outcome(Model.validate, book_input, payload)
+        actual = outcome(book_input.validate, payload)
+        if actual != expected:
+            raise SystemExit(f'BookInput: validation differs for {payload!r}:\n'
+                             f'  Model.validate(): {expected!r}\n  compiled:         {actual!r}')
+
+    valid = next(payload for payload in payloads if outcome(Model.validate, book_input, payload)[0] == 'ok')
+    return (per_call(lambda: Model.validate(book_input, valid), 2000),
+            per_call(lambda: book_input.validate(valid), 2000))
+
+
+def check_parser(queries):
+    """parse_book_list_args() must return what book_list_parser.parse_args() does"""
+    parser = documented_api.book_list_parser
+    compiled = documented_api.parse_book_list_args
+    app = documented_api.app
+    for query in queries:
+        with app.test_request_context(f'/api/books?{query}'):
+            expected, actual = outcome(parser.parse_args), outcome(compiled)
+        if actual != expected:
+            raise SystemExit(f'GET /api/books?{query}: parsed arguments differ:\n'
+                             f'  parse_args(): {expected!r}\n  compiled:     {actual!r}')
+
+    with app.test_request_context(f'/api/books?{queries[2]}'):
+        return per_call(parser.parse_args, 2000), per_call(compiled, 2000)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and time the compiled serializers, validators and parsers of documented_api.py')
+    parser.add_argument('--items', type=int, default=10000, help='items per model')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    print(f'Marshalling {args.items} items per model (best of 5)')
+    print(f'  {"model":<16} {"marshal()":>11} {"compiled":>11} {"speedup":>8}')
+    for name, model in sorted(documented_api.api.models.items()):
+        items = [sample_item(model, rng) for _ in range(args.items)]
+        generic, compiled = check_model(model, items)
+        print(f'  {name:<16} {generic * 1000:>8.1f} ms {compiled * 1000:>8.1f} ms {generic / compiled:>7.1f}x')
+
+    payloads = [sample_payload(rng) for _ in range(args.items)]
+    generic, compiled = check_validation(payloads)
+    print(f'Validating {args.items} BookInput payloads: same results as Model.validate()')
+    print(f'  valid payload: {generic * 1e6:.1f} us -> {compiled * 1e6:.2f} us per request')
+
+    generic, compiled = check_parser(BOOK_LIST_QUERIES)
+    print(f'Parsing {len(BOOK_LIST_QUERIES)} GET /api/books query strings: same results as parse_args()')
+    print(f'  ?{BOOK_LIST_QUERIES[2]}: {generic * 1e6:.1f} us -> {compiled * 1e6:.2f} us per request')
+
+    size, elapsed = check_books_endpoint(args.items, rng)
+    print(f'GET /api/books?limit={args.items}: {elapsed * 1000:.1f} ms, {size} bytes, same body as marshal()')
+    print('OK: compiled serializers, validator and parser match the generic ones')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
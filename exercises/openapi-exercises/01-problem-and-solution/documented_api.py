@@ -3,13 +3,26 @@ Documented Books API using Flask-RESTX
 This API automatically generates Swagger UI documentation at /docs
 """
 
+import os
+import sys
+import threading
+from collections import deque
+from itertools import islice
+
 from flask import Flask
-from flask_restx import Api, Resource, fields
+from flask_restx import Resource, fields
+
+# Compiled marshalling, validation and parsing, the cached spec and the
+# precompressed Swagger UI, shared with the other Flask-RESTX exercise
+# (see exercises/shared/compiled_restx.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from compiled_restx import CompiledApi, compile_parser, precompress_swagger_ui
 
 app = Flask(__name__)
 
+
 # Initialize Flask-RESTX with API metadata
-api = Api(
+api = CompiledApi(
     app,
     version='1.0',
     title='Books API',
@@ -17,7 +30,11 @@ api = Api(
     doc='/docs'  # Swagger UI will be available at /docs
 )
 
+# Serve the Swagger UI bundles precompressed, from long-cached URLs
+precompress_swagger_ui(app)
+
 # Create a namespace for organizing endpoints
+# (CompiledApi namespaces serialize and validate with per-model compiled functions)
 ns = api.namespace('api', description='Book operations')
 
 # Define the Book model for Swagger documentation
@@ -37,6 +54,21 @@ book_input = api.model('BookInput', {
     'isbn': fields.String(description='ISBN number', example='978-0451524935')
 })
 
+# A single entry of the change feed (book is null for deletions)
+change_model = api.model('BookChange', {
+    'seq': fields.Integer(description='Sequence number of the change', example=42),
+    'type': fields.String(description='Kind of change (created and updated carry the full book)',
+                          enum=['created', 'updated', 'deleted']),
+    'id': fields.Integer(description='The book identifier', example=1),
+    'book': fields.Nested(book_model, allow_null=True, description='Book after the change')
+})
+
+change_feed_model = api.model('BookChangeFeed', {
+    'changes': fields.List(fields.Nested(change_model), description='Latest change per book, oldest first'),
+    'last_seq': fields.Integer(description='Pass this as ?since= on the next sync', example=42),
+    'has_more': fields.Boolean(description='More changes are available after last_seq')
+})
+
 # In-memory book storage
 books = {
     1: {'id': 1, 'title': '1984', 'author': 'George Orwell', 'year': 1949, 'isbn': '978-0451524935'},
@@ -46,6 +78,41 @@ books = {
 
 next_id = 4
 
+# Change feed: every create, update and delete gets the next sequence number.
+# Only the most recent CHANGE_RETENTION changes are kept; clients that fall
+# further behind get 410 Gone and must re-fetch /api/books.
+CHANGE_RETENTION = 10000
+change_seq = 0
+changes = deque(maxlen=CHANGE_RETENTION)
+changes_lock = threading.Lock()
+
+
+def record_change(change_type, book_id, book=None):
+    """Append a change to the feed and return its sequence number"""
+    global change_seq
+
+    with changes_lock:
+        change_seq += 1
+        changes.append({
+            'seq': change_seq,
+            'type': change_type,
+            'id': book_id,
+            'book': dict(book) if book is not None else None
+        })
+        return change_seq
+
+# Query parameters for listing books, built once instead of on every request
+book_list_parser = api.parser()
+book_list_parser.add_argument('author', type=str, help='Filter by author name')
+book_list_parser.add_argument('page', type=int, default=1, help='Page number')
+book_list_parser.add_argument('limit', type=int, default=10, help='Books per page')
+parse_book_list_args = compile_parser(book_list_parser)
+
+change_feed_parser = api.parser()
+change_feed_parser.add_argument('since', type=int, default=0, help='Last sequence number already synced')
+change_feed_parser.add_argument('limit', type=int, default=500, help='Maximum number of changes')
+parse_change_feed_args = compile_parser(change_feed_parser)
+
 @ns.route('/books')
 class BookList(Resource):
     @ns.doc('list_books', params={
@@ -59,12 +126,12 @@ class BookList(Resource):
         List all books
         Returns a list of books with optional filtering and pagination.
         """
-        parser = api.parser()
-        parser.add_argument('author', type=str, help='Filter by author name')
-        parser.add_argument('page', type=int, default=1, help='Page number')
-        parser.add_argument('limit', type=int, default=10, help='Books per page')
-        args = parser.parse_args()
+        args = parse_book_list_args()
 
+        # Read the change sequence before the snapshot: every change the
+        # snapshot might miss comes after it, so the feed replays it
+        with changes_lock:
+            synced_seq = change_seq
         result = list(books.values())
 
         # Filter by author if provided
@@ -78,7 +145,8 @@ class BookList(Resource):
         end = start + limit
         paginated = result[start:end]
 
-        return paginated
+        # X-Change-Seq tells clients where to start following /api/books/changes
+        return paginated, 200, {'X-Change-Seq': str(synced_seq)}
 
     @ns.doc('create_book')
     @ns.expect(book_input, validate=True)
@@ -100,6 +168,7 @@ class BookList(Resource):
             'isbn': data.get('isbn')
         }
         books[next_id] = book
+        record_change('created', next_id, book)
         next_id += 1
 
         return book, 201
@@ -144,6 +213,7 @@ class Book(Resource):
         if 'isbn' in data:
             book['isbn'] = data['isbn']
 
+        record_change('updated', id, book)
         return book
 
     @ns.doc('delete_book')
@@ -158,8 +228,55 @@ class Book(Resource):
             api.abort(404, f"Book {id} not found")
 
         del books[id]
+        record_change('deleted', id)
         return '', 204
 
+
+@ns.route('/books/changes')
+class BookChanges(Resource):
+    @ns.doc('list_book_changes', params={
+        'since': 'Last sequence number already synced (default: 0)',
+        'limit': 'Maximum number of changes to return, at least 1 (default: 500)'
+    })
+    @ns.marshal_with(change_feed_model)
+    @ns.response(400, 'limit is less than 1')
+    @ns.response(410, 'Changes since this sequence number are not available')
+    def get(self):
+        """
+        List changes since a sequence number
+        Returns only the latest change per book (deletions included as
+        tombstones), so a sync costs proportional to churn, not catalogue size.
+        """
+        args = parse_change_feed_args()
+        since = args['since']
+        if args['limit'] < 1:
+            api.abort(400, "limit must be at least 1")
+
+        with changes_lock:
+            latest = change_seq
+            oldest = changes[0]['seq'] if changes else latest + 1
+            if since < oldest - 1 or since > latest:
+                # Too old, or from before a server restart: a full resync is needed
+                api.abort(410, f"Changes since {since} are not available, re-fetch /api/books")
+            # Sequence numbers in the feed are contiguous: walk back from the
+            # newest entry so the cost depends on churn, not retention size
+            pending = list(islice(reversed(changes), max(latest - since, 0)))[::-1]
+
+        # Keep only the newest change per book
+        newest = {}
+        for change in pending:
+            newest.pop(change['id'], None)
+            newest[change['id']] = change
+        compacted = list(newest.values())
+
+        page = compacted[:args['limit']]
+        has_more = len(compacted) > len(page)
+        return {
+            'changes': page,
+            'last_seq': page[-1]['seq'] if has_more else latest,
+            'has_more': has_more
+        }
+
 if __name__ == '__main__':
     print("📚 Documented Books API is running!")
     print("📍 API: http://127.0.0.1:5000")
@@ -0,0 +1,472 @@
+"""
+Faster building blocks for the Flask-RESTX exercises.
+
+Used by openapi-exercises/01-problem-and-solution/documented_api.py and
+11-swagger-documentation/example/example11.py, which add this directory
+to sys.path. Each piece returns the same content as the Flask-RESTX code
+it replaces and falls back to that code for anything it does not handle;
+the benchmark.py next to each app checks the compiled functions.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from functools import cached_property, wraps
+from http import HTTPStatus
+
+from flask import abort, current_app, request, send_file, url_for
+from flask_restx import Api, Model, Namespace, fields, marshal, marshal_with
+from flask_restx.api import SwaggerView
+from flask_restx.apidoc import apidoc
+from flask_restx.marshalling import make
+from flask_restx.reqparse import ParseResult
+from flask_restx.representations import output_json
+from flask_restx.utils import merge, unpack
+from werkzeug.http import generate_etag
+
+try:
+    import brotli  # Optional: pip install brotli to also serve .br assets
+except ImportError:
+    brotli = None
+
+
+# ============================================================================
+# COMPILED MARSHALLING
+# ============================================================================
+
+# Field types whose formatting can be inlined into the generated serializer
+FAST_FORMATTERS = {
+    fields.Raw: '{value}',
+    fields.String: 'str({value})',
+    fields.Integer: 'int({value})',
+}
+
+
+def compile_model(model):
+    """
+    Compile a model into a specialized serializer function.
+
+    The generated function produces exactly the same output as
+    flask_restx.marshal() but looks up each field's formatter once,
+    at registration, instead of for every object on every request.
+    Anything unusual (non-dict items, masks, bad values) falls back
+    to the generic marshal() so behaviour and errors stay identical.
+    """
+    resolved = getattr(model, 'resolved', model)
+    scope = {'marshal': marshal, 'model': model}
+    entries = []
+
+    for index, (key, field) in enumerate(resolved.items()):
+        field = field if isinstance(field, dict) else make(field)
+        if isinstance(field, fields.Wildcard) or getattr(model, '__mask__', None):
+            # Wildcards and model masks need the generic algorithm
+            return lambda obj: marshal(obj, model)
+
+        template = FAST_FORMATTERS.get(type(field))
+        simple = (
+            template is not None
+            and field.attribute is None
+            and field.default is None
+            and not field.mask
+            and not hasattr(dict, key)
+        )
+        if simple:
+            value = f'obj.get({key!r})'
+            entries.append(f'{key!r}: None if (v := {value}) is None else {template.format(value="v")}')
+        else:
+            scope[f'field_{index}'] = field
+            if isinstance(field, dict):
+                entries.append(f'{key!r}: marshal(obj, field_{index})')
+            else:
+                entries.append(f'{key!r}: field_{index}.output({key!r}, obj, ordered=False)')
+
+    source = (
+        'def serialize(obj):\n'
+        '    if type(obj) is not dict:\n'
+        '        return marshal(obj, model)\n'
+        '    try:\n'
+        f'        return {{{", ".join(entries)}}}\n'
+        '    except (ValueError, TypeError):\n'
+        '        return marshal(obj, model)\n'
+    )
+    exec(compile(source, f'<serializer {getattr(model, "name", "model")}>', 'exec'), scope)
+    return scope['serialize']
+
+
+# ============================================================================
+# COMPILED VALIDATION
+# ============================================================================
+
+# JSON schema type checks that match jsonschema's Draft 4 semantics
+SCHEMA_TYPE_CHECKS = {
+    'string': 'type(v) is str',
+    'integer': 'type(v) is int',
+    'number': 'type(v) in (int, float)',
+    'boolean': 'type(v) is bool',
+}
+
+# Keywords that never make a document invalid
+SCHEMA_ANNOTATIONS = {'description', 'example', 'readOnly', 'title', 'default', 'discriminator', 'x-mask'}
+
+
+def compile_validator(schema):
+    """
+    Compile a flat object schema into a function returning True when valid.
+
+    The generated check only ever accepts documents jsonschema would accept.
+    When it returns False (or the schema uses unsupported keywords and None
+    is returned instead) the caller runs the real jsonschema validator,
+    which produces the usual error messages.
+    """
+    if set(schema) - SCHEMA_ANNOTATIONS - {'type', 'properties', 'required', 'additionalProperties'}:
+        return None
+    if schema.get('type') != 'object' or schema.get('additionalProperties', False) is not False:
+        return None
+
+    properties = schema.get('properties', {})
+    lines = [
+        'def check(data):',
+        '    if type(data) is not dict:',
+        '        return False',
+    ]
+    for name in schema.get('required', []):
+        lines += [f'    if {name!r} not in data:', '        return False']
+    if 'additionalProperties' in schema:
+        lines += [f'    if not data.keys() <= {set(properties)!r}:', '        return False']
+
+    for name, prop in properties.items():
+        if set(prop) - SCHEMA_ANNOTATIONS - {'type', 'minLength', 'maxLength', 'minimum', 'maximum'}:
+            return None
+        type_check = SCHEMA_TYPE_CHECKS.get(prop.get('type'))
+        if type_check is None:
+            return None
+        checks = [f'not {type_check}']
+        if 'minLength' in prop:
+            checks.append(f'len(v) < {prop["minLength"]!r}')
+        if 'maxLength' in prop:
+            checks.append(f'len(v) > {prop["maxLength"]!r}')
+        if 'minimum' in prop:
+            checks.append(f'v < {prop["minimum"]!r}')
+        if 'maximum' in prop:
+            checks.append(f'v > {prop["maximum"]!r}')
+        lines += [
+            f'    v = data.get({name!r}, MISSING)',
+            f'    if v is not MISSING and ({" or ".join(checks)}):',
+            '        return False',
+        ]
+
+    lines.append('    return True')
+    scope = {'MISSING': object()}
+    exec(compile('\n'.join(lines) + '\n', '<validator>', 'exec'), scope)
+    return scope['check']
+
+
+class CompiledModel(Model):
+    """
+    Model whose validate() first runs a check compiled from its schema.
+
+    Valid payloads are accepted without building a jsonschema validator.
+    Anything else goes through Model.validate(), so the 400 response and
+    its error messages are exactly the same as before.
+    """
+
+    @cached_property
+    def check(self):
+        return None if self.__parents__ else compile_validator(self.__schema__)
+
+    def validate(self, data, resolver=None, format_checker=None):
+        check = self.check
+        if check is not None and check(data):
+            return
+        super().validate(data, resolver, format_checker)
+
+
+def compile_parser(parser):
+    """
+    Compile a RequestParser into a fast callable returning a ParseResult.
+
+    Simple query-string arguments are read and converted directly. JSON
+    requests, repeated or unconvertible values and arguments using options
+    not handled here fall back to parser.parse_args(), which also produces
+    the usual 400 error.
+    """
+    specs = []
+    for arg in parser.args:
+        simple = (
+            arg.action == 'store'
+            and arg.operators == ('=',)
+            and arg.location in (('json', 'values'), 'values', 'args')
+            and arg.type in (str, int)
+            and arg.dest is None
+            and not (arg.required or arg.choices or arg.trim or arg.ignore)
+            and arg.case_sensitive
+            and arg.store_missing
+        )
+        if not simple:
+            return parser.parse_args
+        specs.append((arg.name, arg.type, arg.default, 'args' if arg.location == 'args' else 'values'))
+
+    def parse_args(req=None):
+        req = req or request
+        if req.is_json:
+            return parser.parse_args(req)
+        result = ParseResult()
+        try:
+            for name, convert, default, location in specs:
+                values = getattr(req, location).getlist(name)
+                if not values:
+                    result[name] = default() if callable(default) else default
+                elif len(values) == 1:
+                    result[name] = convert(values[0])
+                else:
+                    return parser.parse_args(req)
+        except ValueError:
+            return parser.parse_args(req)
+        return result
+
+    return parse_args
+
+
+class CompiledNamespace(Namespace):
+    """
+    Namespace whose marshal_with() uses a serializer compiled once per model.
+
+    Swagger documentation is recorded exactly as Namespace.marshal_with()
+    does it. Requests carrying an X-Fields mask use the generic marshaller.
+    Models registered here are CompiledModels; their validators are
+    compiled when attached with expect(..., validate=True), otherwise on
+    first use.
+    """
+
+    def model(self, name=None, model=None, mask=None, strict=False, **kwargs):
+        if self.ordered:
+            return super().model(name, model, mask=mask, strict=strict, **kwargs)
+        model = CompiledModel(name, model, mask=mask, strict=strict)
+        model.__apidoc__.update(kwargs)
+        return self.add_model(name, model)
+
+    def expect(self, *inputs, **kwargs):
+        for expected in inputs:
+            if kwargs.get('validate') and isinstance(expected, CompiledModel):
+                expected.check  # Compile now rather than on the first request
+        return super().expect(*inputs, **kwargs)
+
+    def marshal_with(self, fields, as_list=False, code=HTTPStatus.OK, description=None, **kwargs):
+        if kwargs or self.ordered:
+            return super().marshal_with(fields, as_list, code, description, **kwargs)
+
+        serialize = compile_model(fields)
+
+        def serialize_data(data):
+            if isinstance(data, (list, tuple)):
+                return [serialize(item) for item in data]
+            return serialize(data)
+
+        def wrapper(func):
+            doc = {
+                'responses': {
+                    str(code): (description, [fields], kwargs) if as_list else (description, fields, kwargs)
+                },
+                '__mask__': True,
+            }
+            func.__apidoc__ = merge(getattr(func, '__apidoc__', {}), doc)
+            generic = marshal_with(fields, ordered=self.ordered)(func)
+
+            @wraps(func)
+            def marshalled(*args, **kwargs):
+                if request.headers.get(current_app.config['RESTX_MASK_HEADER']):
+                    return generic(*args, **kwargs)
+                resp = func(*args, **kwargs)
+                if isinstance(resp, tuple):
+                    data, status, headers = unpack(resp)
+                    return serialize_data(data), status, headers
+                return serialize_data(resp)
+
+            return marshalled
+
+        return wrapper
+
+
+# ============================================================================
+# CACHED SWAGGER SPEC
+# ============================================================================
+
+# Clients revalidate with the ETag once this expires
+SPEC_MAX_AGE = 24 * 60 * 60
+
+
+class CachedSwaggerView(SwaggerView):
+    """Serve swagger.json from bytes encoded once, with ETag and gzip support"""
+
+    def get(self):
+        spec = self.api.encoded_spec()
+        if spec is None:
+            return super().get()
+
+        body, gzipped, etag = spec
+        use_gzip = request.accept_encodings['gzip'] > 0
+        response = current_app.response_class(gzipped if use_gzip else body, mimetype='application/json')
+        if use_gzip:
+            response.content_encoding = 'gzip'
+            etag += '-gzip'
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = SPEC_MAX_AGE
+        return response.make_conditional(request)
+
+
+class CompiledApi(Api):
+    """
+    Api whose namespaces, including the default one, are CompiledNamespaces.
+
+    The Swagger spec is serialized and gzipped once and only rebuilt when
+    resources or models are added (the dev reloader restarts the process,
+    so code changes always start from an empty cache).
+    """
+
+    _encoded_spec = None
+
+    def namespace(self, *args, **kwargs):
+        kwargs['ordered'] = kwargs.get('ordered', self.ordered)
+        ns = CompiledNamespace(*args, **kwargs)
+        self.add_namespace(ns)
+        return ns
+
+    def _register_specs(self, app_or_blueprint):
+        if self._add_specs:
+            self._register_view(
+                app_or_blueprint,
+                CachedSwaggerView,
+                self.default_namespace,
+                '/' + self.default_swagger_filename,
+                endpoint='specs',
+                resource_class_args=(self,),
+            )
+            self.endpoints.add('specs')
+
+    def encoded_spec(self):
+        """
+        Return (body, gzipped body, etag) for the current spec.
+
+        Returns None when the spec cannot be rendered, so the caller can
+        fall back to the regular error response.
+        """
+        key = (request.script_root, len(self.resources), len(self.models))
+        cached = self._encoded_spec
+        if cached is None or cached[0] != key:
+            self._schema = None  # Routes changed: let Flask-RESTX rebuild the dict
+            schema = self.__schema__
+            if 'error' in schema:
+                return None
+            body = output_json(schema, HTTPStatus.OK).get_data()
+            cached = (key, body, gzip.compress(body, mtime=0), generate_etag(body))
+            self._encoded_spec = cached
+        return cached[1:]
+
+
+# ============================================================================
+# PRECOMPRESSED SWAGGER UI
+# ============================================================================
+
+# Fingerprinted asset URLs never change content, so they can be cached forever
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.map'}
+
+
+def _write_once(path, digest, compress, decompress):
+    """
+    Write compress() to path unless a previous start already did it.
+
+    A file already there is only reused when it decompresses to content
+    whose SHA-256 is digest; anything else (truncated, stale, or not
+    written by us) is replaced.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if hashlib.sha256(decompress(f.read())).hexdigest() == digest:
+                return path
+    except Exception:
+        pass  # Missing, or not a valid compressed file: write it again
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(compress())
+    os.replace(tmp_path, path)
+    return path
+
+
+def precompress_swagger_ui(app, cache_dir=None):
+    """
+    Serve the Swagger UI static files precompressed from fingerprinted URLs.
+
+    Every file of the Flask-RESTX UI is hashed at start time; text assets
+    are gzipped (and brotli-compressed when the brotli package is
+    installed) into cache_dir, which is reused across restarts once each
+    file is verified against its hash. cache_dir defaults to the app's
+    instance folder, never a directory other users can write to. The UI
+    template then links /swaggerui/assets/<name>.<hash>.<ext>, served with
+    content negotiation and immutable cache headers. Files go through
+    send_file(), so USE_X_SENDFILE hands them to the front server.
+    """
+    cache_dir = cache_dir or app.config.get(
+        'SWAGGER_UI_CACHE_DIR', os.path.join(app.instance_path, 'swaggerui-precompressed')
+    )
+    os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    assets = {}  # fingerprinted name -> (mimetype, {encoding: path})
+    fingerprints = {}  # original filename -> fingerprinted name
+
+    for filename in sorted(os.listdir(apidoc.static_folder)):
+        path = os.path.join(apidoc.static_folder, filename)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        stem, ext = os.path.splitext(filename)
+        digest = hashlib.sha256(data).hexdigest()
+        name = f'{stem}.{digest[:12]}{ext}'
+        variants = {'identity': path}
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            variants['gzip'] = _write_once(
+                os.path.join(cache_dir, name + '.gz'), digest,
+                lambda: gzip.compress(data, 9, mtime=0), gzip.decompress
+            )
+            if brotli is not None:
+                variants['br'] = _write_once(
+                    os.path.join(cache_dir, name + '.br'), digest,
+                    lambda: brotli.compress(data, quality=11), brotli.decompress
+                )
+
+        assets[name] = (mimetypes.guess_type(filename)[0] or 'application/octet-stream', variants)
+        fingerprints[filename] = name
+
+    def serve_swagger_ui_asset(name):
+        if name not in assets:
+            abort(404)
+        mimetype, variants = assets[name]
+
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and request.accept_encodings[candidate] > 0:
+                encoding = candidate
+                break
+
+        response = send_file(variants[encoding], mimetype=mimetype, download_name=name, max_age=ASSET_MAX_AGE)
+        if encoding != 'identity':
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def swagger_static(filename):
+        if filename in fingerprints:
+            return url_for('swagger_ui_asset', name=fingerprints[filename])
+        return url_for('restx_doc.static', filename=filename)
+
+    app.add_url_rule('/swaggerui/assets/<name>', 'swagger_ui_asset', serve_swagger_ui_asset)
+    # Replaces the helper Flask-RESTX registers for its swagger-ui.html template
+    app.add_template_global(swagger_static, 'swagger_static')